@@ -1,3 +1,6 @@
-from .elpk_reader import read_elpk
-from .elpk_writer import write_elpk_page
+from .elpk_reader import read_elpk, read_elpk_many
+from .elpk_writer import patch_elpk, write_elpk, write_elpk_page
+from .name_index import NameIndex
+from .pose_sampler import PoseSample, PoseSampler, get_pose_sampler, sample_pose
 from .structure import *
+from .util import DiskPageCache, MemoryPageCache
@@ -1,20 +1,134 @@
 import gzip
-from typing import Union
+import io
+import mmap
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import repeat
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, List, Optional, Tuple, Union
 
-from .structure import Elpk
-from .util import BinaryReader
+from .structure import (Elpk, ElpkPage, KHMig, KHMode, KHPose, get_page_hash, get_vector_backend,
+                        set_vector_backend)
+from .structure.common import require_numpy
+from .structure.elpk import read_page
+from .util import DiskPageCache, MemoryPageCache, MemoryReader
+from .util.page_cache import get_options_key
 
 
-def read_elpk(file: Union[str, bytearray]) -> Elpk:
+def open_elpk_stream(file: Union[str, bytes, bytearray, memoryview]) -> BinaryIO:
+    """Opens a binary stream of the given ELPK file, which is decompressed on the fly if it has Gzip compression.
+    """
+    f = open(file, 'rb') if isinstance(file, str) else io.BytesIO(file)
+
+    # Gzip magic
+    if f.read(2) != b'\x1f\x8b':
+        f.seek(0)
+        return f
+
+    if isinstance(file, str):
+        f.close()
+        return gzip.open(file, 'rb')
+
+    f.seek(0)
+    return gzip.GzipFile(fileobj=f, mode='rb')
+
+
+def read_elpk(file: Union[str, bytes, bytearray, memoryview, mmap.mmap], lazy=False, use_mmap=False, stream=False,
+              pages: Iterable[Union[str, int]] = None, types: Iterable[type] = None,
+              vertex_arrays=False, index_arrays=False, drop_degenerate=False, decode_dxt=True, keyframe_arrays=False,
+              workers: int = None, keep_raw=False, cache: DiskPageCache = None,
+              memory_cache: MemoryPageCache = None) -> Elpk:
     """Reads an ELPK file and returns an Elpk object.
     If the file has Gzip compression, it will be decompressed before reading.
+    The file is parsed directly from the given buffer (or the mapped file), without making a copy of it.
     :param file: Path to file as a string, or bytes-like object containing the file
+    :param lazy: If True, only the page table is read, and the pages will be ElpkPageProxy objects
+    that are parsed on first access.
+    :param use_mmap: If True and file is a path, the file will be memory-mapped instead of being read into memory.
+    Has no effect on Gzip compressed files, since those have to be decompressed anyway.
+    :param stream: If True, the file will be read (and decompressed) in chunks, and only the header, page table
+    and the pages that are being parsed will be kept in memory. Pages are read in the order they are stored.
+    When used with lazy, the file is kept open until all pages have been loaded, or until Elpk.close is called
+    (the Elpk can also be used as a context manager).
+    :param pages: Names or hashes of the pages to read. If given, all other pages will be skipped.
+    :param types: KHFile types to read (e.g. [KHPose]). If given, files of other types will be skipped without being parsed.
+    Pages with skipped files are marked as partial (see ElpkPage.partial), and cannot be written back unless they
+    were never loaded.
+    :param vertex_arrays: If True, mesh vertices will be decoded into numpy arrays (KHModeMesh.vertex_buffer)
+    instead of KHModeVertex objects. Requires numpy.
+    :param index_arrays: If True, mesh faces (including the ones from triangle strips) will be decoded into
+    one (n, 3) uint16 numpy array per mesh instead of a list of tuples. Requires numpy.
+    :param drop_degenerate: If True, degenerate faces that come from triangle strips will be removed.
+    :param decode_dxt: If False, DXT compressed textures will be kept compressed in KHMig.pixels instead of being
+    decoded to RGBA. Decoding them requires numpy.
+    :param keyframe_arrays: If True, pose channels will be read as KHPoseChannelArray objects, which store
+    the keyframes in two float arrays instead of one KHPoseKeyframe object per keyframe.
+    :param workers: If given, the pages will be parsed in parallel by this many worker processes, which share the file
+    through a memory map (or shared memory, if the file is not an uncompressed file on disk). Pages are still returned
+    in table order. Has no effect when lazy or stream is True.
+    :param keep_raw: If True, the original bytes of each file will be kept (in KHFile.raw), so that files that
+    are not modified can be written back as they are instead of being serialized again (see use_raw in write_elpk).
+    :param cache: If given, parsed pages will be stored in this cache, and pages that were parsed before
+    (with the same options) will be loaded from it instead of being parsed again. Requires vertex_arrays, index_arrays
+    and keyframe_arrays, since pages of individual vertex, face and keyframe objects are faster to parse than to load.
+    :param memory_cache: If given and file is a path, pages will be taken from this cache if the same file
+    (with the same modification time and size) was read before with the same options. Other pages are parsed
+    and added to the cache. Only pages that are not cached are read from the file, which is memory-mapped.
+    Has no effect when lazy or stream is True, and workers is ignored when this is given.
     :return: An Elpk object.
     """
 
+    if vertex_arrays or index_arrays:
+        # Otherwise the error would only be printed while skipping each page with a model
+        require_numpy()
+
+    if cache is not None and not (vertex_arrays and index_arrays and keyframe_arrays):
+        raise Exception('The page cache can only be used with vertex_arrays, index_arrays and keyframe_arrays.')
+
+    page_hashes = None if pages is None else set(map(get_page_hash, pages))
+    file_args = dict()
+    if vertex_arrays or index_arrays or drop_degenerate:
+        file_args[KHMode] = (vertex_arrays, index_arrays, drop_degenerate)
+    if not decode_dxt:
+        file_args[KHMig] = (False,)
+    if keyframe_arrays:
+        file_args[KHPose] = (True,)
+
+    page_args = (None if types is None else set(types), file_args, keep_raw, cache)
+
+    if stream:
+        f = open_elpk_stream(file)
+        try:
+            header = f.read(0x14)
+
+            if header[:4] == b'ELPK':
+                page_count = int.from_bytes(header[0x10:0x14], 'little')
+
+                with MemoryReader(header + f.read(page_count * 12)) as br:
+                    elpk: Elpk = br.read_struct(Elpk, None, lazy, f, page_hashes, *page_args)
+
+                # Lazy pages keep reading from the stream, so the Elpk closes it once they are all loaded
+                if not lazy:
+                    f.close()
+
+                return elpk
+
+            # Not an ELPK container, so the whole file has to be read anyway
+            file = header + f.read()
+        except BaseException:
+            f.close()
+            raise
+
+        f.close()
+
     if isinstance(file, str):
         with open(file, 'rb') as f:
-            file_bytes = f.read()
+            if use_mmap or workers or memory_cache is not None:
+                # The map stays valid after closing the file, and is closed once nothing references it anymore
+                file_bytes = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                file_bytes = f.read()
     else:
         file_bytes = file
 
@@ -22,7 +136,160 @@ def read_elpk(file: Union[str, bytearray]) -> Elpk:
     if file_bytes[:2] == b'\x1f\x8b':
         file_bytes = gzip.decompress(file_bytes)
 
-    with BinaryReader(file_bytes) as br:
-        elpk: Elpk = br.read_struct(Elpk)
+    if lazy:
+        # Page proxies keep a reference to the reader, so it should not be released here
+        return MemoryReader(file_bytes).read_struct(Elpk, None, True, None, page_hashes, *page_args)
+
+    if memory_cache is not None and isinstance(file, str):
+        return read_elpk_cached(file_bytes, file, memory_cache, page_hashes, page_args)
+
+    if workers:
+        # Workers can map the file themselves, unless it was decompressed in memory
+        path = file if isinstance(file, str) and isinstance(file_bytes, mmap.mmap) else None
+        return read_elpk_parallel(file_bytes, path, workers, page_hashes, page_args)
+
+    with MemoryReader(file_bytes) as br:
+        elpk: Elpk = br.read_struct(Elpk, None, False, None, page_hashes, *page_args)
+
+    return elpk
+
+
+def read_elpk_cached(file_bytes: Union[bytes, mmap.mmap], path: str, memory_cache: MemoryPageCache,
+                     page_hashes: Optional[set], page_args: tuple) -> Elpk:
+    """Reads the page table, then takes each page from the cache, or parses it and adds it to the cache."""
+    stat = os.stat(path)
+
+    # The disk cache (last argument) does not affect the parsed pages
+    file_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size,
+                get_options_key(*page_args[:-1], get_vector_backend()))
+
+    with MemoryReader(file_bytes) as br:
+        elpk: Elpk = br.read_struct(Elpk, None, True, None, page_hashes, *page_args)
+
+        pages = list()
+        for i, proxy in enumerate(elpk.pages):
+            key = (*file_key, proxy.page_hash, proxy.page_ptr)
 
+            if (page := memory_cache.get(key)) is None:
+                try:
+                    page = proxy.load()
+                except Exception as e:
+                    print(e)
+                    print(f'Could not read page no. {i} - skipping...')
+                    continue
+
+                memory_cache.put(key, page, proxy.page_size)
+
+            pages.append(page)
+
+    elpk.pages = pages
+    elpk.build_page_index()
     return elpk
+
+
+def read_pages_worker(source: str, shared: bool, page_table: List[Tuple[int, tuple]], page_args: tuple) -> bytes:
+    if shared:
+        shm = SharedMemory(source)
+        buffer = shm.buf
+    else:
+        shm = None
+        with open(source, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    pages: List[Optional[ElpkPage]] = list()
+    with MemoryReader(buffer) as br:
+        for i, entry in page_table:
+            try:
+                pages.append(read_page(br, *entry, *page_args))
+            except Exception as e:
+                print(e)
+                print(f'Could not read page no. {i} - skipping...')
+                pages.append(None)
+
+    # Serialize before releasing the buffer, in case anything still refers to it
+    result = pickle.dumps(pages, pickle.HIGHEST_PROTOCOL)
+
+    if shm is not None:
+        buffer.release()
+        shm.close()
+
+    return result
+
+
+def read_elpk_parallel(file_bytes: Union[bytes, bytearray, memoryview, mmap.mmap], path: Optional[str], workers: int,
+                       page_hashes: Optional[set], page_args: tuple) -> Elpk:
+    """Reads the page table in this process, then parses the pages in a pool of worker processes.
+    If path is given, each worker maps the file by itself. Otherwise, the file is copied into shared memory once.
+    """
+    with MemoryReader(file_bytes) as br:
+        elpk: Elpk = br.read_struct(Elpk, None, True, None, page_hashes, *page_args)
+
+    page_table = [(i, (page.page_hash, page.page_ptr, page.page_size)) for i, page in enumerate(elpk.pages)]
+
+    # Several chunks per worker, so that a few large pages do not keep the other workers idle
+    chunk_size = max(1, -(-len(page_table) // (workers * 4)))
+    chunks = [page_table[i:i + chunk_size] for i in range(0, len(page_table), chunk_size)]
+
+    shm = None
+    if path is None:
+        shm = SharedMemory(create=True, size=max(1, len(file_bytes)))
+        shm.buf[:len(file_bytes)] = file_bytes
+        path = shm.name
+
+    try:
+        # Workers should create the same vector types as this process
+        with ProcessPoolExecutor(workers, initializer=set_vector_backend, initargs=(get_vector_backend(),)) as executor:
+            # map() returns the results in the same order as the chunks
+            results = executor.map(read_pages_worker, repeat(path), repeat(shm is not None), chunks, repeat(page_args))
+            elpk.pages = [page for result in results for page in pickle.loads(result) if page is not None]
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+    elpk.build_page_index()
+    return elpk
+
+
+def read_elpk_worker(path: str, func: Callable[[Elpk], Any], kwargs: dict) -> Tuple[str, bytes]:
+    elpk = read_elpk(path, **kwargs)
+    result = func(elpk) if func else elpk
+
+    # Serialize the result once here, so that the pool only has to send a single bytes object back
+    return path, pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+
+
+def read_elpk_many(paths: Iterable[str], workers: int = None, func: Callable[[Elpk], Any] = None,
+                   **kwargs) -> Iterator[Tuple[str, Any]]:
+    """Reads multiple ELPK files in parallel using a pool of worker processes.
+    Yields a (path, result) tuple for each file as soon as it has been read, so results are not in the same order as paths.
+    If a file could not be read (or func raised an exception), the result is the exception, and the other files are still
+    read. Stopping the iteration early cancels the files that have not started being read yet.
+    :param paths: Paths to the files to read
+    :param workers: Maximum number of worker processes. Defaults to the number of CPUs.
+    :param func: Function that receives the Elpk object in the worker process, and returns the result to send back
+    (for example, only the data that is needed from the file). Must be picklable (defined at module level).
+    If not given, the result is the Elpk object itself. When using lazy=True, func should be given,
+    as page proxies cannot be sent between processes.
+    :param kwargs: Additional arguments that are passed to read_elpk
+    """
+    executor = ProcessPoolExecutor(workers, initializer=set_vector_backend, initargs=(get_vector_backend(),))
+    futures = dict()
+
+    try:
+        futures = {executor.submit(read_elpk_worker, path, func, kwargs): path for path in paths}
+
+        for future in as_completed(futures):
+            try:
+                path, result = future.result()
+                result = pickle.loads(result)
+            except Exception as e:
+                path, result = futures[future], e
+
+            yield path, result
+    finally:
+        # Do not wait for the remaining files if the caller stopped early
+        for future in futures:
+            future.cancel()
+
+        executor.shutdown(wait=False)
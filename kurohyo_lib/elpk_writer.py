@@ -1,16 +1,49 @@
-from typing import List
+import gzip
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, Collection, Dict, List, Optional, Union
 
-from .structure import KHFile, KHFILE_TYPE_TO_MAGIC
-from .util import BinaryReader, Endian
+from .structure import (Elpk, ElpkPage, ElpkPageProxy, KHFile, KHFILE_TYPE_TO_MAGIC, KHPose, get_page_file_types,
+                        get_page_hash)
+from .util import BinaryReader, Endian, MemoryReader
 
+# Size of the chunks used when copying between files
+COPY_CHUNK_SIZE = 0x100000
 
-def write_elpk_page(elpk_page_files: List[KHFile]) -> bytearray:
+
+def get_file_args(pose_tolerance: float = None) -> Optional[Dict[type, tuple]]:
+    """Returns the extra arguments that are passed to the writers of each KHFile type."""
+    return {KHPose: (pose_tolerance,)} if pose_tolerance is not None else None
+
+
+def can_use_raw(file: KHFile, use_raw: Union[bool, Collection[Union[KHFile, type]]]) -> bool:
+    """Returns True if the original bytes of the file should be written instead of serializing it.
+    use_raw is either a bool for all files, or a collection of the files (or KHFile types) to write as they are.
+    """
+    if file.raw is None or not use_raw:
+        return False
+
+    return use_raw is True or file in use_raw or type(file) in use_raw
+
+
+def write_elpk_page(elpk_page_files: List[KHFile], file_args: Dict[type, tuple] = None,
+                    use_raw: Union[bool, Collection[Union[KHFile, type]]] = False) -> bytearray:
+    """Serializes the files of a page.
+    Files that are selected by use_raw (see can_use_raw) and still have their original bytes (see KHFile.raw) are
+    written as is, unless file_args has arguments for their type.
+    """
     br = BinaryReader(endianness=Endian.LITTLE)
 
     for file in elpk_page_files:
         if magic := KHFILE_TYPE_TO_MAGIC.get(type(file)):
             br.write_str_fixed(magic, 4)
-            br.write_struct(file)
+
+            args = file_args.get(type(file), ()) if file_args else ()
+            if not args and can_use_raw(file, use_raw):
+                br.write_bytes(file.raw)
+            else:
+                br.write_struct(file, *args)
         else:
             raise KeyError(f'Unknown KHFile type: {type(file)}')
 
@@ -18,3 +51,265 @@ def write_elpk_page(elpk_page_files: List[KHFile]) -> bytearray:
     br.write_str('end ')
 
     return br.buffer()
+
+
+def get_page_bytes(page: Union[ElpkPage, ElpkPageProxy], file_args: Dict[type, tuple] = None,
+                   use_raw: Union[bool, Collection[Union[KHFile, type]]] = False) -> bytes:
+    """Serializes a page. Pages that have not been loaded yet are copied without being parsed, unless they contain files
+    that file_args has arguments for. Pages that were only partially read (see ElpkPage.partial) cannot be written.
+    """
+    if isinstance(page, ElpkPageProxy):
+        if not page.is_loaded():
+            data = page.read_raw()
+            if not file_args:
+                return data
+
+            try:
+                file_types = get_page_file_types(data)
+            except (KeyError, UnicodeDecodeError):
+                # Pages with unsupported files cannot be parsed, so they are copied even when there are file_args
+                return data
+
+            if not file_args.keys() & file_types:
+                return data
+
+        page = page.load()
+
+    if page.partial:
+        raise Exception(f'Page {page.page_hash:#x} was not fully read (e.g. because of a types filter), '
+                        f'so writing it would remove some of its files.')
+
+    return write_elpk_page(get_page_files(page), file_args, use_raw)
+
+
+def get_page_files(page: Union[ElpkPage, ElpkPageProxy]) -> List[KHFile]:
+    """Returns the files of the page as a single list, grouped by type. Page proxies are loaded first.
+    """
+    return [file for files in page.files.values() for file in files]
+
+
+def get_file_mode(path: str) -> int:
+    """Returns the permissions of the file, or the default permissions for new files if it does not exist."""
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def write_padding(f: BinaryIO, start: int, alignment: int):
+    if padding := -(f.tell() - start) % alignment:
+        f.write(bytes(padding))
+
+
+def write_elpk(elpk: Elpk, file: Union[str, BinaryIO], alignment=16, compress=False, pose_tolerance: float = None,
+               use_raw: Union[bool, Collection[Union[KHFile, type]]] = False):
+    """Writes an Elpk object as an ELPK container.
+    Each page is serialized and written to the file as soon as it is ready, and the page table is filled in at the end.
+    Pages that were not loaded (see ElpkPageProxy) are copied as they are.
+    :param elpk: The Elpk object to write
+    :param file: Path to the output file, or a binary file-like object
+    :param alignment: Alignment of the start of each page, as well as the end of the container
+    :param compress: If True, the output will be compressed with Gzip. The container is written to a temporary file first.
+    :param pose_tolerance: If given, redundant keyframes of KHPose files are removed, and poses are written with short
+    floats when possible. The written values stay within this tolerance of the original ones (see KHPose.__br_write__).
+    All poses are serialized again, even if they were not modified, along with the other files in their pages.
+    :param use_raw: If True, files that were read with keep_raw are copied as they are, as long as their attributes were
+    not changed. Changes to nested objects (such as bones or keyframes) are not detected, so KHFile.mark_dirty has to be
+    called after making them. A collection of files or KHFile types can be given instead, to only copy those.
+    """
+    if isinstance(file, str):
+        # Pages that were not loaded might still be read from the target file (when writing an archive back to where
+        # it was read from), so the target is only replaced once the new file is complete
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(file)))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write_elpk(elpk, f, alignment, compress, pose_tolerance, use_raw)
+
+            # Temporary files are only accessible by the owner, so use the permissions the file would have had otherwise
+            os.chmod(temp_path, get_file_mode(file))
+            os.replace(temp_path, file)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return
+
+    if compress or not file.seekable():
+        # The page table has to be written after the pages, so the container is written to a seekable file first
+        with tempfile.TemporaryFile() as temp:
+            write_elpk(elpk, temp, alignment, pose_tolerance=pose_tolerance, use_raw=use_raw)
+            temp.seek(0)
+
+            if compress:
+                with gzip.GzipFile(fileobj=file, mode='wb') as gz:
+                    shutil.copyfileobj(temp, gz, COPY_CHUNK_SIZE)
+            else:
+                shutil.copyfileobj(temp, file, COPY_CHUNK_SIZE)
+        return
+
+    start = file.tell()
+    page_count = len(elpk.pages)
+
+    # Placeholder for the header and page table
+    file.write(bytes(0x14 + page_count * 12))
+
+    file_args = get_file_args(pose_tolerance)
+
+    table = list()
+    for page in elpk.pages:
+        write_padding(file, start, alignment)
+
+        page_ptr = file.tell() - start
+        page_size = file.write(get_page_bytes(page, file_args, use_raw))
+        table.extend((page.page_hash, page_ptr, page_size))
+
+    write_padding(file, start, alignment)
+    elpk_size = file.tell() - start
+
+    br = BinaryReader(endianness=Endian.LITTLE)
+    br.write_str_fixed('ELPK', 4)
+    br.write_uint32(elpk_size)
+    br.write_uint32(elpk.flags)
+    br.write_uint32(0)
+    br.write_uint32(page_count)
+    br.write_uint32(table)
+
+    file.seek(start)
+    file.write(br.buffer())
+    file.seek(start + elpk_size)
+
+
+def copy_range(src: BinaryIO, dst: BinaryIO, offset: int, size: int):
+    """Copies size bytes at offset from src to the same offset in dst.
+    The copy is done by the kernel when possible (os.copy_file_range, then os.sendfile), without going through Python.
+    Both files should be unbuffered.
+    """
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while size > 0 and (copied := os.copy_file_range(src.fileno(), dst.fileno(), size, offset, offset)):
+                offset += copied
+                size -= copied
+        except OSError:
+            # Not supported for these files (e.g. across file systems on older kernels)
+            pass
+
+    if size > 0 and hasattr(os, 'sendfile'):
+        dst.seek(offset)
+        try:
+            while size > 0 and (copied := os.sendfile(dst.fileno(), src.fileno(), offset, size)):
+                offset += copied
+                size -= copied
+        except OSError:
+            pass
+
+    src.seek(offset)
+    dst.seek(offset)
+    while size > 0 and (data := src.read(min(size, COPY_CHUNK_SIZE))):
+        dst.write(data)
+        size -= len(data)
+
+
+def patch_elpk(file: str, pages: Dict[Union[str, int], Union[ElpkPage, ElpkPageProxy, List[KHFile], bytes]],
+               output: str = None, alignment=16, pose_tolerance: float = None,
+               use_raw: Union[bool, Collection[Union[KHFile, type]]] = False):
+    """Replaces some of the pages of an ELPK file, without rewriting the rest of it.
+    Pages that still fit in the space of the old page are overwritten in place, and the others are appended at the end.
+    Only the replaced pages are serialized, and the page table is updated to point to the new pages.
+    Gzip compressed files cannot be patched.
+    :param file: Path to the ELPK file
+    :param pages: Maps the names or hashes of the pages to replace to the new pages. A page can be given as an ElpkPage,
+    a list of KHFile objects, or the already serialized page. If multiple pages have the same hash, only the first one
+    is replaced.
+    :param output: Path to write the patched file to. If not given, the file is modified in place. Otherwise, the unchanged
+    parts of the file are copied to the output.
+    :param alignment: Alignment of the pages that are appended at the end of the file
+    :param pose_tolerance: Same as in write_elpk. Only applies to pages that are not given as bytes.
+    :param use_raw: Same as in write_elpk.
+    """
+    file_args = get_file_args(pose_tolerance)
+
+    new_pages = dict()
+    for name_or_hash, page in pages.items():
+        if isinstance(page, (ElpkPage, ElpkPageProxy)):
+            page = get_page_bytes(page, file_args, use_raw)
+        elif isinstance(page, list):
+            page = write_elpk_page(page, file_args, use_raw)
+
+        new_pages[get_page_hash(name_or_hash)] = page
+
+    with open(file, 'rb' if output else 'r+b', buffering=0) as src:
+        header = src.read(0x14)
+
+        # Gzip magic
+        if header[:2] == b'\x1f\x8b':
+            raise Exception('Gzip compressed ELPK files cannot be patched.')
+
+        if header[:4] != b'ELPK':
+            raise Exception(f'Invalid magic: Expected ELPK, got \"{header[:4]}\"')
+
+        page_count = int.from_bytes(header[0x10:0x14], 'little')
+        with MemoryReader(src.read(page_count * 12)) as br:
+            table = br.read_uint32(page_count * 3)
+
+        page_table = [list(table[i:i + 3]) for i in range(0, len(table), 3)]
+        file_size = os.fstat(src.fileno()).st_size
+
+        # Each page can use the space up to the start of the next page
+        page_ptrs = sorted(entry[1] for entry in page_table) + [file_size]
+        slots = dict()
+        for entry in page_table:
+            if entry[0] in new_pages and entry[0] not in slots:
+                slots[entry[0]] = (entry, next(ptr for ptr in page_ptrs if ptr > entry[1]))
+
+        if missing := new_pages.keys() - slots.keys():
+            raise KeyError(f'Pages not found: {", ".join(map(hex, missing))}')
+
+        if output:
+            dst = open(output, 'w+b', buffering=0)
+            dst.truncate(file_size)
+
+            # Copy everything except the pages that are being replaced
+            offset = 0
+            for entry, slot_end in sorted(slots.values(), key=lambda slot: slot[0][1]):
+                copy_range(src, dst, offset, entry[1] - offset)
+                offset = slot_end
+            copy_range(src, dst, offset, file_size - offset)
+        else:
+            dst = src
+
+        with dst:
+            end = file_size
+            for page_hash, (entry, slot_end) in slots.items():
+                page = new_pages[page_hash]
+                page_ptr, page_size = entry[1], entry[2]
+
+                if len(page) <= slot_end - page_ptr:
+                    dst.seek(page_ptr)
+                    dst.write(page)
+
+                    # Clear the rest of the old page
+                    if len(page) < page_size:
+                        dst.write(bytes(page_size - len(page)))
+                else:
+                    page_ptr = end + (-end % alignment)
+                    dst.seek(end)
+                    dst.write(bytes(page_ptr - end))
+                    dst.write(page)
+                    end = page_ptr + len(page)
+
+                entry[1:] = page_ptr, len(page)
+
+            if end != file_size:
+                dst.seek(end)
+                dst.write(bytes(-end % alignment))
+                end += -end % alignment
+
+                dst.seek(4)
+                dst.write(end.to_bytes(4, 'little'))
+
+            br = BinaryReader(endianness=Endian.LITTLE)
+            br.write_uint32([value for entry in page_table for value in entry])
+
+            dst.seek(0x14)
+            dst.write(br.buffer())
@@ -0,0 +1,92 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+from .structure import (Elpk, ElpkPage, ElpkPageProxy, KHBase, KHCame, KHFile, KHImag, KHLigh, KHMateTexture, KHMode,
+                        KHModeMesh, KHModeNode, KHPose, KHSkel, KHSkelBone)
+from .structure.common import hash_fnv0_many
+
+
+def get_node_names(node: Union[KHModeNode, KHSkelBone]) -> Iterator[str]:
+    """Yields the names of the node and all of its descendants."""
+    nodes = [node]
+    while nodes:
+        node = nodes.pop()
+        yield node.name
+        nodes.extend(node.children)
+
+
+def get_file_names(file: KHFile) -> Iterable[str]:
+    """Returns the names in the file that other files refer to by hash."""
+    if isinstance(file, KHSkel):
+        return get_node_names(file.root_bone)
+    if isinstance(file, KHBase):
+        return file.bones.keys()
+    if isinstance(file, KHMode):
+        return get_node_names(file.root_node)
+    if isinstance(file, KHPose):
+        return (bone.name for bone in file.bones)
+    if isinstance(file, (KHCame, KHLigh)):
+        return (node.name for node in file.nodes)
+
+    return ()
+
+
+class NameIndex:
+    """Maps FNV0 hashes (see hash_fnv0) back to the names they were computed from.
+    Names can be added directly, or collected from loaded files, so that hashes such as KHModeMesh.bone_hashes and
+    KHMateTexture.hash can be resolved with a single lookup. If multiple names have the same hash, the first one is kept.
+    """
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: Dict[int, str] = dict()
+        self.add_names(names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name_hash: int) -> bool:
+        return name_hash in self.names
+
+    def add_names(self, names: Iterable[str]):
+        names = list(dict.fromkeys(names))
+
+        for name_hash, name in zip(hash_fnv0_many(names), names):
+            self.names.setdefault(name_hash, name)
+
+    def add_file(self, file: KHFile):
+        if isinstance(file, KHImag):
+            # Textures already store their hashes
+            for texture in file.textures.values():
+                self.names.setdefault(texture.hash, texture.name)
+        else:
+            self.add_names(get_file_names(file))
+
+    def add_page(self, page: Union[ElpkPage, ElpkPageProxy], page_name: str = None):
+        """Adds the names from all files in the page. page_name is the name of the page, if it is known."""
+        if page_name is not None:
+            self.add_names((page_name,))
+
+        for files in page.files.values():
+            for file in files:
+                self.add_file(file)
+
+    def add_elpk(self, elpk: Elpk):
+        """Adds the names from all pages. Page proxies are loaded first."""
+        for page in elpk.pages:
+            self.add_page(page)
+
+    def get(self, name_hash: int, default: str = None) -> Optional[str]:
+        return self.names.get(name_hash, default)
+
+    def resolve(self, hashes: Iterable[int]) -> List[Optional[str]]:
+        """Returns the name of each hash, or None for hashes that are not in the index."""
+        return list(map(self.names.get, hashes))
+
+    def get_bone_names(self, mesh: KHModeMesh) -> List[Optional[str]]:
+        """Returns the names of the bones that the vertex weights of the mesh refer to."""
+        return self.resolve(mesh.bone_hashes or ())
+
+    def get_texture_name(self, texture: KHMateTexture) -> Optional[str]:
+        return self.names.get(texture.hash)
+
+    def get_page_name(self, page: Union[ElpkPage, ElpkPageProxy]) -> Optional[str]:
+        return self.names.get(page.page_hash)
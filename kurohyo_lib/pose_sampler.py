@@ -0,0 +1,135 @@
+import weakref
+from typing import Iterable, List, Union
+
+from .structure import KHPose, KHPoseChannel, KHPoseChannelArray
+from .structure.common import require_numpy
+
+# Order of the sampled values of each bone
+SCALE_SLOTS = slice(0, 3)
+ROTATION_SLOTS = slice(3, 6)
+LOCATION_SLOTS = slice(6, 9)
+CAMERA_ROLL_SLOT = 9
+CAMERA_FOV_SLOT = 10
+CAMERA_FOCUS_SLOTS = slice(11, 14)
+SLOT_COUNT = 14
+
+
+class PoseSample:
+    """Values of all bones of a pose at the sampled frames.
+    Arrays have one row per bone (in the same order as KHPose.bones), and one column per frame.
+    Values without any keyframes are set to the initial values of the bone, or NaN for the camera values.
+    """
+    frames: 'numpy.ndarray'
+    bone_names: List[str]
+
+    # (bones, frames, 3)
+    scale: 'numpy.ndarray'
+    rotation: 'numpy.ndarray'
+    location: 'numpy.ndarray'
+    camera_focus: 'numpy.ndarray'
+
+    # (bones, frames)
+    camera_roll: 'numpy.ndarray'
+    camera_fov: 'numpy.ndarray'
+
+
+class PoseSampler:
+    """Evaluates all channels of a pose at many frames at once, with linear interpolation between keyframes.
+    Values before the first keyframe and after the last one are the same as the first and last keyframes.
+    The keyframes are copied when the sampler is created, so changes to the pose after that are not seen by it.
+    """
+
+    def __init__(self, pose: KHPose):
+        np = require_numpy()
+
+        self.bone_names = [bone.name for bone in pose.bones]
+
+        self.defaults = np.full((len(pose.bones), SLOT_COUNT), np.nan)
+
+        slots, frames, values = list(), list(), list()
+        for i, bone in enumerate(pose.bones):
+            self.defaults[i, SCALE_SLOTS] = bone.initial_scale[:3]
+            self.defaults[i, ROTATION_SLOTS] = bone.initial_rotation[:3]
+            self.defaults[i, LOCATION_SLOTS] = bone.initial_location[:3]
+
+            bone_channels = (*bone.scale, *bone.rotation, *bone.location,
+                             bone.camera_roll, bone.camera_fov, *bone.camera_focus)
+
+            for slot, channel in enumerate(bone_channels):
+                if channel is None:
+                    continue
+
+                channel_frames, channel_values = get_channel_arrays(channel)
+                if len(channel_frames) == 0:
+                    continue
+
+                slots.append(i * SLOT_COUNT + slot)
+                frames.append(channel_frames)
+                values.append(channel_values)
+
+        self.slots = slots
+        self.channel_frames = frames
+        self.channel_values = values
+
+        self._last_sample: PoseSample = None
+
+    def sample(self, frames: Union[Iterable[float], 'numpy.ndarray']) -> PoseSample:
+        """Returns the values of all bones at the given frames. The result for the last frames is kept and reused."""
+        np = require_numpy()
+
+        frames = np.asarray(frames, dtype=np.float64).reshape(-1)
+
+        if self._last_sample is not None and np.array_equal(self._last_sample.frames, frames):
+            return self._last_sample
+
+        result = np.repeat(self.defaults.reshape(-1, 1), len(frames), axis=1)
+
+        # np.interp does the search and interpolation for all frames of a channel at once
+        for slot, channel_frames, channel_values in zip(self.slots, self.channel_frames, self.channel_values):
+            result[slot] = np.interp(frames, channel_frames, channel_values)
+
+        result = result.reshape(len(self.bone_names), SLOT_COUNT, len(frames))
+
+        sample = PoseSample()
+        sample.frames = frames
+        sample.bone_names = self.bone_names
+        sample.scale = result[:, SCALE_SLOTS].transpose(0, 2, 1)
+        sample.rotation = result[:, ROTATION_SLOTS].transpose(0, 2, 1)
+        sample.location = result[:, LOCATION_SLOTS].transpose(0, 2, 1)
+        sample.camera_roll = result[:, CAMERA_ROLL_SLOT]
+        sample.camera_fov = result[:, CAMERA_FOV_SLOT]
+        sample.camera_focus = result[:, CAMERA_FOCUS_SLOTS].transpose(0, 2, 1)
+
+        self._last_sample = sample
+        return sample
+
+
+def get_channel_arrays(channel: Union[KHPoseChannel, KHPoseChannelArray]):
+    """Returns the frames and values of the channel's keyframes as two float64 arrays."""
+    np = require_numpy()
+
+    if isinstance(channel, KHPoseChannelArray):
+        return np.asarray(channel.frames, dtype=np.float64), np.asarray(channel.values, dtype=np.float64)
+
+    count = len(channel.keyframes)
+    return (np.fromiter((kf.frame for kf in channel.keyframes), np.float64, count),
+            np.fromiter((kf.value for kf in channel.keyframes), np.float64, count))
+
+
+# Samplers are kept as long as their pose exists
+_samplers: 'weakref.WeakKeyDictionary[KHPose, PoseSampler]' = weakref.WeakKeyDictionary()
+
+
+def get_pose_sampler(pose: KHPose, refresh=False) -> PoseSampler:
+    """Returns the sampler of the pose, creating it on first use.
+    refresh should be True if the pose was modified after its sampler was created.
+    """
+    if refresh or (sampler := _samplers.get(pose)) is None:
+        sampler = _samplers[pose] = PoseSampler(pose)
+
+    return sampler
+
+
+def sample_pose(pose: KHPose, frames: Union[Iterable[float], 'numpy.ndarray'], refresh=False) -> PoseSample:
+    """Evaluates the pose at the given frames (see PoseSampler). Requires numpy."""
+    return get_pose_sampler(pose, refresh).sample(frames)
@@ -1,7 +1,8 @@
-from .common import hash_fnv0
-from .elpk import Elpk, ElpkPage, MAGIC_TO_KHFILE_TYPE, KHFILE_TYPE_TO_MAGIC
+from .common import hash_fnv0, hash_fnv0_many
+from .elpk import (Elpk, ElpkPage, ElpkPageProxy, KHFILE_TYPE_TO_MAGIC,
+                   MAGIC_TO_KHFILE_TYPE, get_page_file_types, get_page_hash)
 from .kh_enums import (KHMateMaterialFlag, KHModeModelFlag, KHModeNodeFlag,
-                       KHModeVertexFlag, KHPoseChannelFlag, KHPoseFlag)
+                       KHModeVertexFlag, KHPoseChannelFlag, KHPoseFlag, count_flags, has_flags)
 from .khbase import KHBase, KHBaseBone
 from .khcame import KHCame, KHCameNode
 from .khfile import KHFile, KHString
@@ -10,6 +11,8 @@ from .khligh import KHLigh
 from .khmate import KHMate, KHMateGroup, KHMateMaterial, KHMateTexture
 from .khmig import KHMig
 from .khmode import KHMode, KHModeMesh, KHModeNode, KHModeVertex
-from .khpose import (KHPose, KHPoseBone, KHPoseChannel, KHPoseKeyframe,
-                     KHPoseKeyframeFloat, KHPoseKeyframeShort)
+from .khpose import (KHPose, KHPoseBone, KHPoseChannel, KHPoseChannelArray,
+                     KHPoseKeyframe, KHPoseKeyframeFloat, KHPoseKeyframeShort,
+                     reduce_channel, reduce_keyframes)
 from .khskel import KHSkel, KHSkelBone
+from .vector import Euler, Vector, get_vector_backend, set_vector_backend
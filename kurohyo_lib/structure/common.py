@@ -1,21 +1,75 @@
-from typing import List, Union
-from mathutils import Vector
+from functools import lru_cache
+from typing import Iterable, List, Union
 
-from ..util import BinaryReader
+from ..util import BinaryReader, MemoryReader
+from .vector import Vector, new_vector
 
+FNV0_PRIME = 0x811C9DC5
+
+# Names are hashed in batches with numpy when there are at least this many of them
+FNV0_BATCH_THRESHOLD = 64
 
-def hash_fnv0(string):
-    max_size = 2**32
-    prime = 0x811C9DC5
 
+# The same names (bones, textures, pages) are hashed many times, so the results are kept
+@lru_cache(maxsize=0x10000)
+def hash_fnv0(string):
     result = 0
-    for c in string:
-        result = (result * prime) % max_size
-        result ^= ord(c)
+    for c in map(ord, string):
+        # Same as modulo 2**32
+        result = ((result * FNV0_PRIME) & 0xFFFFFFFF) ^ c
 
     return result
 
 
+def hash_fnv0_many(strings: Iterable[str]) -> List[int]:
+    """Returns the hash_fnv0 of each string. Large batches are hashed with numpy (if it is installed),
+    one character position at a time for all strings.
+    """
+    strings = list(strings)
+
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+    if np is None or len(strings) < FNV0_BATCH_THRESHOLD:
+        return list(map(hash_fnv0, strings))
+
+    lengths = np.fromiter(map(len, strings), np.int64, len(strings))
+    max_length = int(lengths.max(initial=0))
+
+    # One row of code points per string, padded with zeros
+    chars = np.zeros((len(strings), max_length), np.uint32)
+    if max_length:
+        chars[:] = np.array(strings, dtype=f'<U{max_length}').view('<u4').reshape(len(strings), max_length)
+
+    # Products fit in 64 bits, so wrapping around does not change the lower 32 bits
+    result = np.zeros(len(strings), np.uint64)
+    for i in range(max_length):
+        hashed = ((result * np.uint64(FNV0_PRIME)) & np.uint64(0xFFFFFFFF)) ^ chars[:, i]
+        result = np.where(lengths > i, hashed, result)
+
+    return result.tolist()
+
+
+def require_numpy():
+    """Imports numpy, which is only needed for the vectorized (array-based) code paths."""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('numpy is required for reading/writing vertex, face and texture data as arrays') from None
+
+    return numpy
+
+
+def read_view(br: BinaryReader, size) -> memoryview:
+    """Reads the given number of bytes, without copying them if the reader supports it."""
+    if isinstance(br, MemoryReader):
+        return br.read_view(size)
+
+    return memoryview(br.read_bytes(size))
+
+
 def read_short_float(br: BinaryReader, count=None):
     val = br.read_int16(count)
     return (val / 1023.0) if count is None else tuple(map(lambda x: x / 1023.0, val))
@@ -23,38 +77,43 @@ def read_short_float(br: BinaryReader, count=None):
 
 def write_short_float(br: BinaryReader, value):
     values = (
-        int(value * 1023)
+        round(value * 1023)
         if not br.is_iterable(value)
-        else list(map(lambda val: int(val * 1023), value))
+        else list(map(lambda val: round(val * 1023), value))
     )
     br.write_int16(values)
 
 
 def read_short_float_vector(br: BinaryReader, count=None):
     if count is None:
-        return Vector(read_short_float(br, 3))
+        return new_vector(read_short_float(br, 3))
+
+    return tuple(map(new_vector, [read_short_float(br, 3) for _ in range(count)]))
+
 
-    return tuple(map(Vector, [read_short_float(br, 3) for _ in range(count)]))
+def is_vector_list(br: BinaryReader, value) -> bool:
+    # Vectors are iterable too, so only treat iterables of iterables as lists of vectors
+    return br.is_iterable(value) and (len(value) == 0 or br.is_iterable(value[0]))
 
 
 def write_short_float_vector(br: BinaryReader, value: Union[Vector, List[Vector]]):
-    if br.is_iterable(value):
+    if is_vector_list(br, value):
         for val in value:
-            write_short_float(br, list(val.xyz))
+            write_short_float(br, list(val[:3]))
     else:
-        write_short_float(br, list(value.xyz))
+        write_short_float(br, list(value[:3]))
 
 
 def read_vector(br: BinaryReader, count=None):
     if count is None:
-        return Vector(br.read_float(3))
+        return new_vector(br.read_float(3))
 
-    return tuple(map(Vector, [br.read_float(3) for _ in range(count)]))
+    return tuple(map(new_vector, [br.read_float(3) for _ in range(count)]))
 
 
 def write_vector(br: BinaryReader, value: Union[Vector, List[Vector]]):
-    if br.is_iterable(value):
+    if is_vector_list(br, value):
         for val in value:
-            br.write_float(list(val.xyz))
+            br.write_float(list(val[:3]))
     else:
-        br.write_float(list(value.xyz))
+        br.write_float(list(value[:3]))
@@ -1,7 +1,8 @@
 from collections import defaultdict
-from typing import DefaultDict, List
+from typing import BinaryIO, Callable, Collection, DefaultDict, Dict, List, Optional, Set, Union
 
-from ..util import BinaryReader, BrStruct, Whence
+from ..util import BinaryReader, BrStruct, DiskPageCache, MemoryReader, Whence
+from .common import hash_fnv0, read_view
 from .khbase import KHBase
 from .khcame import KHCame
 from .khfile import KHFile
@@ -12,6 +13,7 @@ from .khmig import KHMig
 from .khmode import KHMode
 from .khpose import KHPose
 from .khskel import KHSkel
+from .vector import get_vector_backend
 
 MAGIC_TO_KHFILE_TYPE = {
     'base': KHBase,
@@ -28,12 +30,31 @@ MAGIC_TO_KHFILE_TYPE = {
 KHFILE_TYPE_TO_MAGIC = dict([(value, key) for key, value in MAGIC_TO_KHFILE_TYPE.items()])
 
 class ElpkPage(BrStruct):
-    def __br_read__(self, br: BinaryReader, page_hash, page_size):
+    # True if some of the files of the page were not read (see types in __br_read__), so writing the page back would
+    # remove them
+    partial = False
+
+    def __br_read__(self, br: BinaryReader, page_hash, page_size, types: Collection[type] = None,
+                    file_args: Dict[type, tuple] = None, keep_raw=False, cache: DiskPageCache = None):
+        """If types is given, files of other types will be skipped without being parsed.
+        file_args maps KHFile types to additional arguments that should be passed to their __br_read__ method.
+        If keep_raw is True, the original bytes of each file will be stored in KHFile.raw.
+        If cache is given, the files will be loaded from it if the same page was parsed before, and stored in it otherwise.
+        """
         self.page_hash = page_hash
         self.files: DefaultDict[type, List[KHFile]] = defaultdict(list)
 
         end_offset = br.pos() + page_size
 
+        if cache is not None:
+            key = cache.get_key(read_view(br, min(page_size, br.size() - br.pos())), types, file_args, keep_raw,
+                                get_vector_backend())
+            if (entry := cache.load(key)) is not None:
+                self.files, self.partial = entry
+                return
+
+            br.seek(end_offset - page_size)
+
         try:
             while br.pos() < end_offset:
                 magic = br.read_str(4)
@@ -42,17 +63,155 @@ class ElpkPage(BrStruct):
                     break
 
                 file_type = MAGIC_TO_KHFILE_TYPE[magic]
-                self.files[file_type].append(br.read_struct(file_type))
+
+                if types is not None and file_type not in types:
+                    file_type.skip(br)
+                    self.partial = True
+                    continue
+
+                args = file_args.get(file_type, ()) if file_args else ()
+
+                file_start = br.pos()
+                file: KHFile = br.read_struct(file_type, None, *args)
+
+                if keep_raw:
+                    file_end = br.pos()
+                    br.seek(file_start)
+                    file.raw = bytes(read_view(br, file_end - file_start))
+
+                self.files[file_type].append(file)
         except KeyError:
             print(f'Unsupported file magic: \"{magic}\" - skipping page...')
+            self.partial = True
         except UnicodeDecodeError:
             print(f'Unable to read file magic - skipping page...')
+            self.partial = True
+
+        if cache is not None:
+            cache.store(key, (self.files, self.partial))
+
+
+def get_page_hash(name_or_hash: Union[str, int]) -> int:
+    return hash_fnv0(name_or_hash) if isinstance(name_or_hash, str) else name_or_hash
+
+
+def get_page_file_types(data: bytes) -> Set[type]:
+    """Returns the types of the files in a serialized page, skipping over the files without parsing them."""
+    file_types = set()
+
+    with MemoryReader(data) as br:
+        while br.pos() < br.size() and (magic := br.read_str(4)) != 'end ':
+            file_type = MAGIC_TO_KHFILE_TYPE[magic]
+            file_type.skip(br)
+            file_types.add(file_type)
+
+    return file_types
+
+
+def read_page(source: Union[BinaryReader, BinaryIO], page_hash, page_ptr, page_size, *page_args) -> ElpkPage:
+    """Reads one page from either a BinaryReader or a binary file-like object.
+    File-like objects (such as a streaming decompressor) are read up to the end of the page only.
+    Additional arguments are passed to ElpkPage.__br_read__.
+    """
+    if isinstance(source, BinaryReader):
+        with source.seek_to(page_ptr):
+            return source.read_struct(ElpkPage, None, page_hash, page_size, *page_args)
+
+    source.seek(page_ptr)
+    with MemoryReader(source.read(page_size)) as br:
+        return br.read_struct(ElpkPage, None, page_hash, page_size, *page_args)
+
+
+class ElpkPageProxy:
+    """Placeholder for an ElpkPage that is only parsed when its files are first accessed.
+    The parsed page is kept, so each page is read at most once.
+    """
+
+    def __init__(self, source: Union[BinaryReader, BinaryIO], page_hash, page_ptr, page_size, *page_args):
+        self.page_hash = page_hash
+        self.page_ptr = page_ptr
+        self.page_size = page_size
+
+        # Called with the proxy once the page has been loaded
+        self.on_load: Optional[Callable[['ElpkPageProxy'], None]] = None
+
+        self._source = source
+        self._page_args = page_args
+        self._page: Optional[ElpkPage] = None
+
+    def is_loaded(self) -> bool:
+        return self._page is not None
+
+    def read_raw(self) -> bytes:
+        """Returns the original bytes of the page without parsing it. Can only be used before the page is loaded."""
+        if self._page is not None:
+            raise Exception('Page is already loaded')
+
+        if isinstance(self._source, BinaryReader):
+            with self._source.seek_to(self.page_ptr):
+                return bytes(read_view(self._source, self.page_size))
+
+        self._source.seek(self.page_ptr)
+        return self._source.read(self.page_size)
+
+    def load(self) -> ElpkPage:
+        if self._page is None:
+            self._page = read_page(self._source, self.page_hash, self.page_ptr, self.page_size, *self._page_args)
+
+            # The source is shared between all proxies of the same Elpk, so just drop this reference
+            self._source = None
+
+            if self.on_load is not None:
+                self.on_load(self)
+
+        return self._page
+
+    @property
+    def files(self) -> DefaultDict[type, List[KHFile]]:
+        return self.load().files
 
 
 class Elpk(BrStruct):
-    def __br_read__(self, br: BinaryReader):
-        self.pages: List[ElpkPage] = list()
+    flags: int
+    pages: List[Union[ElpkPage, ElpkPageProxy]]
+    page_index: Optional[Dict[int, Union[ElpkPage, ElpkPageProxy]]]
+
+    # Stream that the page proxies are read from (see stream in read_elpk), until all of them have been loaded
+    stream: Optional[BinaryIO]
+
+    def __init__(self):
+        self.flags = 0
+        self.pages = list()
+        self.page_index = None
+        self.stream = None
+
+        self._unloaded_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Closes the stream that the pages are read from, if there is one. Pages that were not loaded yet cannot be
+        loaded after this. The stream is also closed automatically once all pages have been loaded.
+        """
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def on_page_load(self, page: ElpkPageProxy):
+        self._unloaded_count -= 1
+        if self._unloaded_count == 0:
+            self.close()
 
+    def __br_read__(self, br: BinaryReader, lazy=False, stream: BinaryIO = None, page_hashes: Collection[int] = None,
+                    *page_args):
+        """If stream is given, br should only contain the header and page table, and the pages will be read from the stream.
+        If page_hashes is given, only the pages with these hashes will be read.
+        Additional arguments are passed to ElpkPage.__br_read__ when reading each page.
+        """
         try:
             magic = br.read_str(4)
         except:
@@ -62,24 +221,75 @@ class Elpk(BrStruct):
             # Check if the files are not inside an ELPK container
             if magic in MAGIC_TO_KHFILE_TYPE:
                 br.seek(-4, Whence.CUR)
-                self.pages.append(br.read_struct(ElpkPage, None, 0, br.size()))
+                if lazy:
+                    self.pages.append(ElpkPageProxy(br, 0, br.pos(), br.size() - br.pos(), *page_args))
+                else:
+                    self.pages.append(br.read_struct(ElpkPage, None, 0, br.size(), *page_args))
+
+                self.build_page_index()
                 return
 
             raise Exception(f'Invalid magic: Expected ELPK, got \"{magic}\"')
 
         elpk_size = br.read_uint32()
-        flags = br.read_uint32()
+        self.flags = br.read_uint32()
         padding = br.read_uint32()
         page_count = br.read_uint32()
 
-        for i in range(page_count):
-            page_hash = br.read_uint32()
-            page_ptr = br.read_uint32()
-            page_size = br.read_uint32()
-
-            with br.seek_to(page_ptr):
-                try:
-                    self.pages.append(br.read_struct(ElpkPage, None, page_hash, page_size))
-                except Exception as e:
-                    print(e)
-                    print(f'Could not read page no. {i} - skipping...')
+        table = br.read_uint32(page_count * 3)
+        page_table = [table[i:i + 3] for i in range(0, len(table), 3)]
+
+        if page_hashes is not None:
+            page_table = [entry for entry in page_table if entry[0] in page_hashes]
+            page_count = len(page_table)
+
+        source = br if stream is None else stream
+
+        if lazy:
+            self.pages.extend(ElpkPageProxy(source, *entry, *page_args) for entry in page_table)
+            self.build_page_index()
+
+            if stream is not None:
+                # The stream is only needed until each page has been loaded
+                self.stream = stream
+                self._unloaded_count = len(self.pages)
+                for page in self.pages:
+                    page.on_load = self.on_page_load
+
+                if not self.pages:
+                    self.close()
+
+            return
+
+        # Read pages in the order they are stored, so that streams never have to go backwards
+        pages = dict()
+        for i in sorted(range(page_count), key=lambda i: page_table[i][1]):
+            try:
+                pages[i] = read_page(source, *page_table[i], *page_args)
+            except Exception as e:
+                print(e)
+                print(f'Could not read page no. {i} - skipping...')
+
+        self.pages.extend(pages[i] for i in range(page_count) if i in pages)
+        self.build_page_index()
+
+    def build_page_index(self):
+        """Maps the hashes of the pages to the pages themselves. Should be called again after modifying the pages list.
+        If multiple pages have the same hash, only the first one will be in the index.
+        """
+        self.page_index = dict()
+        for page in self.pages:
+            self.page_index.setdefault(page.page_hash, page)
+
+    def get_page(self, name_or_hash: Union[str, int]) -> Optional[ElpkPage]:
+        """Returns the page with the given name or hash, or None if it was not found.
+        Page proxies are loaded before being returned.
+        """
+        if self.page_index is None:
+            self.build_page_index()
+
+        page = self.page_index.get(get_page_hash(name_or_hash))
+        if isinstance(page, ElpkPageProxy):
+            return page.load()
+
+        return page
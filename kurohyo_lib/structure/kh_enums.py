@@ -1,15 +1,32 @@
 from enum import IntFlag
 
+# Number of set bits of each flag value that was counted
+_flag_counts = dict()
+
+
+def has_flags(flags: int, other: int) -> bool:
+    """Returns True if all bits of other are set in flags. Works on plain ints as well as flag enums."""
+    return int.__and__(flags, other) == other
+
+
+def count_flags(flags: int) -> int:
+    """Returns the number of bits that are set in flags. Works on plain ints as well as flag enums."""
+    if (count := _flag_counts.get(flags)) is None:
+        count = _flag_counts[flags] = bin(flags).count('1')
+
+    return count
+
 
 class FlagEnum(IntFlag):
+    # IntFlag operators create a new flag for each result, so these use int operations instead
     def __contains__(self, other) -> bool:
-        if isinstance(other, (int, IntFlag)):
-            return (self & other) == other
+        if isinstance(other, int):
+            return int.__and__(self, other) == other
 
         return super().__contains__(other)
 
     def __len__(self) -> int:
-        return len([x for x in bin(self) if x == '1'])
+        return count_flags(self)
 
 
 class KHMateMaterialFlag(FlagEnum):
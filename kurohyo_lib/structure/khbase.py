@@ -1,10 +1,9 @@
 from typing import Dict
 
-from mathutils import Euler
-
-from ..util import BinaryReader, BrStruct
-from .common import read_vector
+from ..util import BinaryReader, BrStruct, Whence
+from .common import read_vector, write_vector
 from .khfile import KHFile, KHString
+from .vector import new_euler
 
 
 class KHBase(KHFile):
@@ -18,21 +17,52 @@ class KHBase(KHFile):
             bone = br.read_struct(KHBaseBone)
             self.bones[bone.name] = bone
 
+    def __br_write__(self, br: BinaryReader):
+        br.write_struct(KHString(), self.name)
+        br.write_uint16(len(self.bones))
+        br.write_struct(tuple(self.bones.values()))
+
+    @classmethod
+    def skip(cls, br: BinaryReader):
+        KHString.skip(br)
+
+        for _ in range(br.read_uint16()):
+            # Flags, name, scale, rotation, location
+            br.seek(2, Whence.CUR)
+            KHString.skip(br)
+            br.seek(0x24, Whence.CUR)
+
     def update(self, other: 'KHBase'):
         for name, bone in other.bones.items():
             if name in self.bones:
                 self.bones[name].update(bone)
 
+        self.mark_dirty()
+
 
 class KHBaseBone(BrStruct):
+    __slots__ = ('flags', 'name', 'scale', 'rotation', 'location')
+
+    def __init__(self):
+        # Unknown, kept from the file when reading
+        self.flags = 0
+
     def __br_read__(self, br: BinaryReader):
-        flags = br.read_uint16()
+        self.flags = br.read_uint16()
         self.name: str = br.read_struct(KHString).data
 
         self.scale = read_vector(br)
-        self.rotation = Euler(read_vector(br)[:])
+        self.rotation = new_euler(read_vector(br))
         self.location = read_vector(br)
 
+    def __br_write__(self, br: BinaryReader):
+        br.write_uint16(self.flags)
+        br.write_struct(KHString(), self.name)
+
+        write_vector(br, self.scale)
+        write_vector(br, self.rotation)
+        write_vector(br, self.location)
+
     def update(self, other: 'KHBaseBone'):
         self.scale.cross(other.scale)
         self.rotation += other.rotation
@@ -1,10 +1,9 @@
 from typing import List
 
-from mathutils import Vector
-
-from ..util import BinaryReader, BrStruct
+from ..util import BinaryReader, BrStruct, Whence
 from .common import read_vector, write_vector
 from .khfile import KHFile, KHString
+from .vector import Vector
 
 
 class KHCame(KHFile):
@@ -18,8 +17,21 @@ class KHCame(KHFile):
         br.write_uint16(len(self.nodes))
         br.write_struct(self.nodes)
 
+    @classmethod
+    def skip(cls, br: BinaryReader):
+        for _ in range(br.read_uint16()):
+            # Flags, name, camera flags, 2 vectors and 4 floats
+            br.seek(2, Whence.CUR)
+            KHString.skip(br)
+            br.seek(0x2C, Whence.CUR)
+
 
 class KHCameNode(BrStruct):
+    __slots__ = (
+        'name', 'initial_location', 'initial_focus_point', 'initial_roll_degrees', 'initial_fov_degrees', 'clip_start',
+        'clip_end',
+    )
+
     name: str
 
     initial_location: Vector
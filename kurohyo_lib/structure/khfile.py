@@ -1,7 +1,11 @@
+from typing import Optional
+
 from ..util import BinaryReader, BrStruct, Whence
 
 
 class KHString(BrStruct):
+    __slots__ = ('data',)
+
     def __br_read__(self, br: BinaryReader):
         length = br.read_uint16()
         self.data = br.read_str(length)
@@ -13,6 +17,39 @@ class KHString(BrStruct):
         with br.seek_to(-(length + 2), whence=Whence.CUR):
             br.write_uint16(length)
 
+    @staticmethod
+    def skip(br: BinaryReader):
+        br.seek(br.read_uint16(), Whence.CUR)
+
 
 class KHFile(BrStruct):
-    pass
+    # Original bytes of the file (without the magic), if it was read with keep_raw and its attributes were not changed
+    # since then. These are only written when the caller opts in (see use_raw in write_elpk)
+    raw: Optional[bytes] = None
+
+    def __setattr__(self, name, value):
+        # Changing any attribute of the file means that the original bytes cannot be used anymore
+        if name != 'raw' and self.raw is not None:
+            super().__setattr__('raw', None)
+
+        super().__setattr__(name, value)
+
+    def mark_dirty(self):
+        """Discards the original bytes of the file, so that it is serialized again when writing.
+        Changes to the attributes of the file itself are tracked automatically, but changes to its nested objects (such
+        as bones, nodes or keyframes) are not, so this should be called after modifying any of them.
+        """
+        self.raw = None
+
+    def set_computed(self, name: str, value):
+        """Sets an attribute that is derived from the rest of the file while writing it.
+        This does not change the contents of the file, so the original bytes are kept.
+        """
+        super().__setattr__(name, value)
+
+    @classmethod
+    def skip(cls, br: BinaryReader):
+        """Advances the reader to the end of the file without parsing it.
+        Should be overridden to avoid creating any objects when the file size can be computed directly.
+        """
+        br.read_struct(cls)
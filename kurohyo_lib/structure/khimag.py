@@ -1,6 +1,6 @@
 from typing import Dict
 
-from ..util import BinaryReader, BrStruct
+from ..util import BinaryReader, BrStruct, Whence
 from .kh_enums import KHMateMaterialFlag
 from .khfile import KHFile, KHString
 
@@ -14,9 +14,30 @@ class KHImag(KHFile):
             for texture in br.read_struct(KHImagTexture, texture_count)
         }
 
+    def __br_write__(self, br: BinaryReader):
+        br.write_uint16(len(self.textures))
+        br.write_struct(tuple(self.textures.values()))
+
+    @classmethod
+    def skip(cls, br: BinaryReader):
+        for _ in range(br.read_uint16()):
+            # Flags, hash, name
+            br.seek(6, Whence.CUR)
+            KHString.skip(br)
+
 
 class KHImagTexture(BrStruct):
+    __slots__ = ('flags', 'hash', 'name')
+
+    def __init__(self):
+        self.flags = KHMateMaterialFlag.IS_TEXTURE
+
     def __br_read__(self, br: BinaryReader):
-        flags = KHMateMaterialFlag(br.read_uint16())
+        self.flags = KHMateMaterialFlag(br.read_uint16())
         self.hash = br.read_uint32()
         self.name: str = br.read_struct(KHString).data
+
+    def __br_write__(self, br: BinaryReader):
+        br.write_uint16(int(self.flags))
+        br.write_uint32(self.hash)
+        br.write_struct(KHString(), self.name)
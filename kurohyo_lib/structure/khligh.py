@@ -1,4 +1,4 @@
-from ..util import BinaryReader, BrStruct
+from ..util import BinaryReader, BrStruct, Whence
 from .khfile import KHFile, KHString
 
 
@@ -8,14 +8,43 @@ class KHLigh(KHFile):
 
         self.nodes = br.read_struct(KHLighNode, node_count)
 
+    def __br_write__(self, br: BinaryReader):
+        br.write_uint16(len(self.nodes))
+        br.write_struct(self.nodes)
+
+    @classmethod
+    def skip(cls, br: BinaryReader):
+        for _ in range(br.read_uint16()):
+            # Flags, name, unk count, 3 floats, 13 bytes, 5 floats
+            br.seek(2, Whence.CUR)
+            KHString.skip(br)
+            br.seek(0x31, Whence.CUR)
+
 
 class KHLighNode(BrStruct):
+    __slots__ = ('flags', 'unk_count', 'name', 'unk_floats0', 'unk_bytes', 'unk_floats1')
+
+    def __init__(self):
+        # Unknown, kept from the file when reading
+        self.flags = 0
+        self.unk_count = 0
+
     def __br_read__(self, br: BinaryReader):
-        flags = br.read_uint16()
+        self.flags = br.read_uint16()
         self.name: str = br.read_struct(KHString).data
 
-        unk_count = br.read_uint32()
+        self.unk_count = br.read_uint32()
 
         self.unk_floats0 = br.read_float(3)
         self.unk_bytes = br.read_uint8(13)
         self.unk_floats1 = br.read_float(5)
+
+    def __br_write__(self, br: BinaryReader):
+        br.write_uint16(self.flags)
+        br.write_struct(KHString(), self.name)
+
+        br.write_uint32(self.unk_count)
+
+        br.write_float(self.unk_floats0)
+        br.write_uint8(self.unk_bytes)
+        br.write_float(self.unk_floats1)
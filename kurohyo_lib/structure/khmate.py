@@ -1,6 +1,6 @@
 from typing import Tuple
 
-from ..util import BinaryReader, BrStruct
+from ..util import BinaryReader, BrStruct, Whence
 from .kh_enums import KHMateMaterialFlag
 from .khfile import KHFile, KHString
 
@@ -12,12 +12,34 @@ class KHMate(KHFile):
         material_count = br.read_uint16()
         self.materials = br.read_struct(KHMateMaterial, material_count)
 
+    def __br_write__(self, br: BinaryReader):
+        br.write_uint16(len(self.materials))
+        br.write_struct(self.materials)
+
+    @classmethod
+    def skip(cls, br: BinaryReader):
+        for _ in range(br.read_uint16()):
+            # Flags, name, shader hash, 2 floats
+            br.seek(2, Whence.CUR)
+            KHString.skip(br)
+            br.seek(0xC, Whence.CUR)
+
+            for _ in range(5):
+                # Each texture has flags and a hash
+                br.seek(br.read_uint16() * 6, Whence.CUR)
+
 
 class KHMateMaterial(BrStruct):
+    __slots__ = ('groups', 'flags', 'name', 'shader_hash', 'unk_floats')
+
     groups: Tuple['KHMateGroup']
 
+    def __init__(self):
+        # Unknown, kept from the file when reading
+        self.flags = KHMateMaterialFlag(0)
+
     def __br_read__(self, br: BinaryReader):
-        flags = KHMateMaterialFlag(br.read_uint16())
+        self.flags = KHMateMaterialFlag(br.read_uint16())
         self.name: str = br.read_struct(KHString).data
         self.shader_hash = br.read_uint32()
 
@@ -26,17 +48,52 @@ class KHMateMaterial(BrStruct):
         # This count is fixed
         self.groups = br.read_struct(KHMateGroup, 5)
 
+    def __br_write__(self, br: BinaryReader):
+        if len(self.groups) != 5:
+            raise Exception(f'Material \"{self.name}\" should have exactly 5 texture groups')
+
+        br.write_uint16(int(self.flags))
+        br.write_struct(KHString(), self.name)
+        br.write_uint32(self.shader_hash)
+
+        br.write_float(self.unk_floats)
+        br.write_struct(self.groups)
+
 
 class KHMateGroup(BrStruct):
+    __slots__ = ('textures',)
+
     textures: Tuple['KHMateTexture']
 
+    def __init__(self):
+        self.textures = tuple()
+
     def __br_read__(self, br: BinaryReader):
         texture_count = br.read_uint16()
         self.textures = br.read_struct(KHMateTexture, texture_count)
 
+    def __br_write__(self, br: BinaryReader):
+        br.write_uint16(len(self.textures))
+        br.write_struct(self.textures)
+
 
 class KHMateTexture(BrStruct):
+    __slots__ = ('flags', 'is_texture', 'hash')
+
+    def __init__(self):
+        self.flags = KHMateMaterialFlag.IS_TEXTURE
+        self.is_texture = True
+
     def __br_read__(self, br: BinaryReader):
-        flags = KHMateMaterialFlag(br.read_uint16())
-        self.is_texture = KHMateMaterialFlag.IS_TEXTURE in flags
+        self.flags = KHMateMaterialFlag(br.read_uint16())
+        self.is_texture = KHMateMaterialFlag.IS_TEXTURE in self.flags
         self.hash = br.read_uint32()
+
+    def __br_write__(self, br: BinaryReader):
+        # Keep the original flags, unless is_texture was changed
+        flags = self.flags
+        if (KHMateMaterialFlag.IS_TEXTURE in flags) != self.is_texture:
+            flags = KHMateMaterialFlag.IS_TEXTURE if self.is_texture else KHMateMaterialFlag(0)
+
+        br.write_uint16(int(flags))
+        br.write_uint32(self.hash)
@@ -1,27 +1,262 @@
-from itertools import chain
+import sys
+from array import array
 from math import ceil
 
-from ..util import BinaryReader, BrStruct, Whence
+from ..util import BinaryReader, Whence
+from .common import read_view, require_numpy
 from .kh_enums import KHMigBlockFlag, KHMigImageFormatFlag
+from .khfile import KHFile
+
+HIGH_NIBBLES = bytes(i >> 4 for i in range(256))
+LOW_NIBBLES = bytes(i & 0xF for i in range(256))
+SHIFTED_NIBBLES = bytes((i & 0xF) << 4 for i in range(256))
+
+BITS_PER_PIXEL = {
+    KHMigImageFormatFlag.RGBA5650: 16,
+    KHMigImageFormatFlag.RGBA5551: 16,
+    KHMigImageFormatFlag.RGBA4444: 16,
+    KHMigImageFormatFlag.RGBA8888: 32,
+    KHMigImageFormatFlag.INDEX4: 4,
+    KHMigImageFormatFlag.INDEX8: 8,
+    KHMigImageFormatFlag.INDEX16: 16,
+    KHMigImageFormatFlag.INDEX32: 32,
+    KHMigImageFormatFlag.DXT1: 4,
+    KHMigImageFormatFlag.DXT3: 8,
+    KHMigImageFormatFlag.DXT5: 8,
+    KHMigImageFormatFlag.DXT1EXT: 4,
+    KHMigImageFormatFlag.DXT3EXT: 8,
+    KHMigImageFormatFlag.DXT5EXT: 8,
+}
+
+INDEX_FORMATS = {
+    KHMigImageFormatFlag.INDEX4: 1,
+    KHMigImageFormatFlag.INDEX8: 1,
+    KHMigImageFormatFlag.INDEX16: 2,
+    KHMigImageFormatFlag.INDEX32: 4,
+}
+
+DXT_FORMATS = (
+    KHMigImageFormatFlag.DXT1, KHMigImageFormatFlag.DXT3, KHMigImageFormatFlag.DXT5,
+    KHMigImageFormatFlag.DXT1EXT, KHMigImageFormatFlag.DXT3EXT, KHMigImageFormatFlag.DXT5EXT,
+)
+
+# Bit layout of each channel (R, G, B, A) of the 16-bit formats, as (bit count, parts)
+# Each part is (byte index, shift, mask, destination shift), and channels without parts are fully opaque
+COLOR16_CHANNELS = {
+    KHMigImageFormatFlag.RGBA5650: (
+        (5, ((0, 0, 0x1F, 0),)),
+        (6, ((0, 5, 0x07, 0), (1, 0, 0x07, 3))),
+        (5, ((1, 3, 0x1F, 0),)),
+        (8, ()),
+    ),
+    KHMigImageFormatFlag.RGBA5551: (
+        (5, ((0, 0, 0x1F, 0),)),
+        (5, ((0, 5, 0x07, 0), (1, 0, 0x03, 3))),
+        (5, ((1, 2, 0x1F, 0),)),
+        (1, ((1, 7, 0x01, 0),)),
+    ),
+    KHMigImageFormatFlag.RGBA4444: (
+        (4, ((0, 0, 0x0F, 0),)),
+        (4, ((0, 4, 0x0F, 0),)),
+        (4, ((1, 0, 0x0F, 0),)),
+        (4, ((1, 4, 0x0F, 0),)),
+    ),
+}
+
+
+def expand_bits(value, bits) -> int:
+    """Scales a value with the given bit count to 8 bits by repeating its bits."""
+    result = 0
+
+    shift = 8 - bits
+    while shift > -bits:
+        result |= (value << shift) if shift >= 0 else (value >> -shift)
+        shift -= bits
+
+    return result & 0xFF
 
 
 # Unswizzle algorithm from here:
 # https://github.com/nickworonekin/puyotools/blob/a949eb452e4743b94517ca08e720759cc0381a25/src/PuyoTools.Core/Textures/Gim/GimTextureDecoder.cs#L333
-def unswizzle(data, width, height):
-    result = list()
+def unswizzle(data, width, height) -> bytes:
+    """Unswizzles the data of an image with the given width (in bytes) and height.
+    Swizzled data is stored in blocks of 16 bytes * 8 rows, so each row of the image is made by joining
+    one 16 byte row from every block in the same row of blocks.
+    """
+    data = memoryview(data)
 
     row_blocks = width // 16
+    block_row_size = width * 8
 
+    if width % 16 == 0 and height % 8 == 0 and len(data) >= width * height:
+        # View the data as 8 byte items, so that each block row is 2 items, and move
+        # the same item of each block in a row of blocks at once using strided slices
+        src = data.cast('B').cast('Q')
+        result = bytearray(width * height)
+        dst = memoryview(result).cast('Q')
+
+        row_size = width // 8
+        for block_row in range(0, (height // 8) * row_size * 8, row_size * 8):
+            for y in range(8):
+                dst_start = block_row + y * row_size
+                src_start = block_row + y * 2
+
+                dst[dst_start: dst_start + row_size: 2] = src[src_start: src_start + row_size * 8: 16]
+                dst[dst_start + 1: dst_start + row_size: 2] = src[src_start + 1: src_start + row_size * 8: 16]
+
+        return bytes(result)
+
+    rows = list()
     for y in range(height):
-        for x in range(width):
-            block_x = x // 16
-            block_y = y // 8
+        start = (y // 8) * block_row_size + (y % 8) * 16
+        rows.extend(data[block: block + 16] for block in range(start, start + row_blocks * 128, 128))
+
+    return b''.join(rows)
+
+
+def unpack_nibbles(data) -> bytes:
+    """Splits each byte into 2 bytes, with the high nibble first."""
+    data = bytes(data)
+
+    result = bytearray(len(data) * 2)
+    result[0::2] = data.translate(HIGH_NIBBLES)
+    result[1::2] = data.translate(LOW_NIBBLES)
+
+    return bytes(result)
+
+
+def pack_nibbles(data) -> bytes:
+    """Joins each 2 bytes (with values up to 15) into 1 byte, with the first one as the high nibble."""
+    data = bytes(data)
+
+    high = data[0::2].translate(SHIFTED_NIBBLES)
+    low = data[1::2].translate(LOW_NIBBLES).ljust(len(high), b'\x00')
+
+    return (int.from_bytes(high, 'little') | int.from_bytes(low, 'little')).to_bytes(len(high), 'little')
+
+
+def expand_palette(indices: bytes, palette: bytes, index_size=1) -> bytes:
+    """Replaces each index with its 4 byte palette entry. Indices outside the palette are replaced with zeros."""
+    if index_size == 1:
+        palette = palette[:256 * 4].ljust(256 * 4, b'\x00')
+
+        # Translate the indices once for each channel, and interleave the results
+        result = bytearray(len(indices) * 4)
+        for channel in range(4):
+            result[channel::4] = indices.translate(palette[channel::4])
+
+        return bytes(result)
+
+    indices = array('H' if index_size == 2 else 'I', indices)
+    if sys.byteorder == 'big':
+        indices.byteswap()
+
+    entries = [palette[i: i + 4] for i in range(0, len(palette), 4)]
+    if indices and max(indices) >= len(entries):
+        entries.extend([bytes(4)] * (max(indices) + 1 - len(entries)))
+
+    return b''.join(map(entries.__getitem__, indices))
+
+
+def decode_colors(data, image_format: KHMigImageFormatFlag) -> bytes:
+    """Converts pixels (or palette entries) in one of the RGBA formats to RGBA8888."""
+    data = bytes(data)
+
+    if image_format == KHMigImageFormatFlag.RGBA8888:
+        return data
+
+    if image_format not in COLOR16_CHANNELS:
+        raise Exception(f'Unsupported MIG color format: {image_format}')
+
+    # Low and high bytes of each pixel
+    pixel_bytes = (data[0::2], data[1::2])
+
+    result = bytearray(len(pixel_bytes[0]) * 4)
+    for i, (bits, parts) in enumerate(COLOR16_CHANNELS[image_format]):
+        if not parts:
+            result[i::4] = b'\xFF' * len(pixel_bytes[0])
+            continue
+
+        # Extract and combine the bits of the channel, then scale it to 8 bits
+        channel = 0
+        for byte_index, shift, mask, dest_shift in parts:
+            table = bytes((((x >> shift) & mask) << dest_shift) for x in range(256))
+            channel |= int.from_bytes(pixel_bytes[byte_index].translate(table), 'little')
+
+        channel = channel.to_bytes(len(pixel_bytes[0]), 'little')
+        result[i::4] = channel.translate(bytes(expand_bits(x, bits) if x < (1 << bits) else 0 for x in range(256)))
 
-            block_index = block_x + (block_y * row_blocks)
-            block_address = (block_index * 16 * 8)
+    return bytes(result)
 
-            result.append(data[block_address + (x - (block_x * 16)) + ((y - (block_y * 8)) * 16)])
-    return result
+
+def decompress_dxt(data, width, height, image_format: KHMigImageFormatFlag) -> bytes:
+    """Decodes DXT1/3/5 data to RGBA8888, for all blocks of the image at once.
+    Blocks use the PSP layout: color indices come before the 2 colors, colors have red in the lowest bits,
+    and the alpha data of DXT3/5 comes after the color data.
+    """
+    np = require_numpy()
+
+    is_dxt1 = image_format in (KHMigImageFormatFlag.DXT1, KHMigImageFormatFlag.DXT1EXT)
+    block_size = 8 if is_dxt1 else 16
+
+    blocks_x, blocks_y = ceil(width / 4), ceil(height / 4)
+    blocks = np.frombuffer(data, np.uint8, blocks_x * blocks_y * block_size).reshape(-1, block_size).astype(np.uint32)
+
+    # Color endpoints
+    endpoints = np.stack((blocks[:, 4] | (blocks[:, 5] << 8), blocks[:, 6] | (blocks[:, 7] << 8)), axis=1)
+    r, g, b = endpoints & 0x1F, (endpoints >> 5) & 0x3F, endpoints >> 11
+    endpoints = np.stack(((r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)), axis=2)
+
+    c0, c1 = endpoints[:, 0], endpoints[:, 1]
+    opaque = np.full((len(blocks), 1), 255, np.uint32)
+
+    # DXT1 blocks with the first color not greater than the second use 3 colors and transparency
+    four_colors = np.ones(len(blocks), bool)
+    if is_dxt1:
+        four_colors = (blocks[:, 4] | (blocks[:, 5] << 8)) > (blocks[:, 6] | (blocks[:, 7] << 8))
+
+    four = four_colors[:, None]
+    palette = np.stack((
+        np.concatenate((c0, opaque), axis=1),
+        np.concatenate((c1, opaque), axis=1),
+        np.concatenate((np.where(four, (2 * c0 + c1) // 3, (c0 + c1) // 2), opaque), axis=1),
+        np.concatenate((np.where(four, (c0 + 2 * c1) // 3, 0), np.where(four, opaque, 0)), axis=1),
+    ), axis=1)
+
+    # 2-bit index for each pixel, 4 pixels per byte, in row order
+    shifts = np.arange(0, 8, 2, dtype=np.uint32)
+    indices = ((blocks[:, :4, None] >> shifts) & 3).reshape(-1, 16)
+    pixels = np.take_along_axis(palette, indices[:, :, None], axis=1)
+
+    if not is_dxt1:
+        alpha = blocks[:, 8:]
+
+        if image_format in (KHMigImageFormatFlag.DXT3, KHMigImageFormatFlag.DXT3EXT):
+            # 4-bit alpha for each pixel, 2 pixels per byte
+            shifts = np.array([0, 4], dtype=np.uint32)
+            pixels[:, :, 3] = ((alpha[:, :, None] >> shifts) & 0xF).reshape(-1, 16) * 17
+        else:
+            a0, a1 = alpha[:, 6:7], alpha[:, 7:8]
+
+            alpha_palette = np.concatenate([a0, a1] + [
+                np.where(a0 > a1, ((7 - i) * a0 + i * a1) // 7,
+                         (((5 - i) * a0 + i * a1) // 5) if i < 5 else (0 if i == 5 else 255))
+                for i in range(1, 7)
+            ], axis=1)
+
+            # 3-bit alpha indices, stored in a 48-bit little endian value
+            alpha_bits = np.zeros(len(blocks), np.uint64)
+            for i in range(6):
+                alpha_bits |= alpha[:, i].astype(np.uint64) << np.uint64(i * 8)
+
+            shifts = np.arange(0, 48, 3, dtype=np.uint64)
+            alpha_indices = ((alpha_bits[:, None] >> shifts) & np.uint64(7)).astype(np.intp)
+            pixels[:, :, 3] = np.take_along_axis(alpha_palette, alpha_indices, axis=1)
+
+    # Move each block to its place in the image
+    image = pixels.reshape(blocks_y, blocks_x, 4, 4, 4).transpose(0, 2, 1, 3, 4).reshape(blocks_y * 4, blocks_x * 4, 4)
+
+    return image[:height, :width].astype(np.uint8).tobytes()
 
 
 def round_up(value, multiple):
@@ -31,8 +266,33 @@ def round_up(value, multiple):
     return value + (multiple - (value % multiple))
 
 
-class KHMig(BrStruct):
-    def __br_read__(self, br: BinaryReader) -> None:
+class KHMig(KHFile):
+    width: int
+    height: int
+    image_format: KHMigImageFormatFlag
+
+    # RGBA8888 pixels, palette indices if the image is indexed but has no palette,
+    # or compressed blocks if the image is DXT compressed but was read with decode_dxt=False
+    pixels: bytes
+
+    # Format of the data in pixels (one of the above)
+    pixel_format: KHMigImageFormatFlag
+
+    # Number of pixels in each row of pixels, including the padding of aligned rows. 0 if the rows are not padded
+    row_length: int
+
+    def __init__(self):
+        self.width = 0
+        self.height = 0
+        self.image_format = KHMigImageFormatFlag.RGBA8888
+        self.pixel_format = KHMigImageFormatFlag.RGBA8888
+        self.pixels = b''
+        self.row_length = 0
+
+    def __br_read__(self, br: BinaryReader, decode_dxt=True) -> None:
+        """If decode_dxt is False, DXT compressed images will be kept compressed (e.g. for uploading directly to the GPU).
+        Decoding DXT images requires numpy.
+        """
         mig_end = None
 
         palette_data = image_data = None
@@ -64,15 +324,11 @@ class KHMig(BrStruct):
                 pixels_per_row = width
                 pixel_per_column = height
 
-                if image_format == KHMigImageFormatFlag.RGBA8888:
-                    bit_per_pixel = 32
-                elif image_format == KHMigImageFormatFlag.INDEX4:
-                    bit_per_pixel = 4
-                elif image_format == KHMigImageFormatFlag.INDEX8:
-                    bit_per_pixel = 8
-                else:
+                if image_format not in BITS_PER_PIXEL:
                     raise Exception('Unsupported MIG image format')
 
+                bit_per_pixel = BITS_PER_PIXEL[image_format]
+
                 stride = int(ceil(float(width) * bit_per_pixel / 8))
                 if stride % width_align != 0:
                     stride = round_up(stride, width_align)
@@ -86,29 +342,37 @@ class KHMig(BrStruct):
                 data_start_offset, data_end_offset = br.read_uint32(2)
                 br.seek(data_start + data_start_offset, Whence.BEGIN)
 
-                data = br.read_uint8(stride * pixel_per_column)
+                data = read_view(br, stride * pixel_per_column)
 
                 if br.pos() != (data_start + data_end_offset):
                     raise Exception('Unexpected MIG offset')
 
-                if pixel_order == 1:
+                # DXT data is stored in 4x4 blocks, which are never swizzled
+                if pixel_order == 1 and image_format not in DXT_FORMATS:
                     data = unswizzle(data, stride, pixel_per_column)
 
                 if block_id == KHMigBlockFlag.IMAGE_BLOCK:
-                    if image_format == KHMigImageFormatFlag.RGBA8888:
-                        image_data = data
-                        self.width = width
-                        self.height = height
-                    elif image_format == KHMigImageFormatFlag.INDEX8:
-                        image_data = data
-                        self.width = width
-                        self.height = height
-                    elif image_format == KHMigImageFormatFlag.INDEX4:
-                        image_data = list(chain(*map(lambda x: (x >> 4, x & 0xF), data)))
-                        self.width = width
-                        self.height = height
+                    self.width = width
+                    self.height = height
+                    self.image_format = image_format
+                    self.pixel_format = KHMigImageFormatFlag.RGBA8888
+                    self.row_length = pixels_per_row
+
+                    if image_format == KHMigImageFormatFlag.INDEX4:
+                        image_data = unpack_nibbles(data)
+                        self.pixel_format = image_format
+                    elif image_format in INDEX_FORMATS:
+                        image_data = bytes(data)
+                        self.pixel_format = image_format
+                    elif image_format in DXT_FORMATS and not decode_dxt:
+                        image_data = bytes(data)
+                        self.pixel_format = image_format
+                    elif image_format in DXT_FORMATS:
+                        image_data = decompress_dxt(data, pixels_per_row, pixel_per_column, image_format)
+                    else:
+                        image_data = decode_colors(data, image_format)
                 else:
-                    palette_data = data
+                    palette_data = decode_colors(data, image_format)
 
             # Go to next block
             br.seek(block_start + next_block_rel_offset, Whence.BEGIN)
@@ -123,7 +387,94 @@ class KHMig(BrStruct):
         # Seek to the end of the file to avoid breaking the ELPK page reading
         br.seek(mig_end, Whence.BEGIN)
 
-        if palette_data:
-            self.pixels = list(chain(*map(lambda i: palette_data[i * 4: (i + 1) * 4], image_data)))
+        if palette_data is not None and self.image_format in INDEX_FORMATS:
+            self.pixels = expand_palette(image_data, palette_data, INDEX_FORMATS[self.image_format])
+            self.pixel_format = KHMigImageFormatFlag.RGBA8888
         else:
             self.pixels = image_data
+
+    def __br_write__(self, br: BinaryReader):
+        """Writes the image in pixel_format, without swizzling. Images that were read from another color format
+        (or with a palette) are written as RGBA8888.
+        pixels should contain either exactly width * height pixels, or rows of row_length pixels (as they are read).
+        """
+        pixel_format = self.pixel_format
+        bit_per_pixel = BITS_PER_PIXEL[pixel_format]
+
+        if pixel_format in DXT_FORMATS:
+            # Align to 4x4 blocks
+            width_align, height_align = bit_per_pixel // 2, 4
+        else:
+            width_align, height_align = 16, 8
+
+        stride = round_up(int(ceil(float(self.width) * bit_per_pixel / 8)), width_align)
+        pixel_per_column = round_up(self.height, height_align)
+
+        data = bytes(self.pixels)
+        if pixel_format not in DXT_FORMATS:
+            # Indices of INDEX4 images are stored one per byte
+            pixel_size = 1 if pixel_format == KHMigImageFormatFlag.INDEX4 else bit_per_pixel // 8
+            row_size = self.width * pixel_size
+            aligned_row_size = (stride * 8 // bit_per_pixel) * pixel_size
+
+            if len(data) == row_size * self.height:
+                src_row_size = row_size
+            elif self.row_length:
+                # Rows can be padded to a different alignment than the one used for writing (e.g. palette indices)
+                src_row_size = self.row_length * pixel_size
+            else:
+                src_row_size = aligned_row_size
+
+            if len(data) != aligned_row_size * pixel_per_column or src_row_size != aligned_row_size:
+                if src_row_size < row_size or len(data) < src_row_size * self.height:
+                    raise Exception(f'Unexpected MIG pixel data size ({len(self.pixels)}) for a {self.width}x{self.height} '
+                                    f'image')
+
+                # Keep the visible part of each row, and pad it to the aligned size
+                rows = [data[i: i + row_size].ljust(aligned_row_size, b'\x00')
+                        for i in range(0, src_row_size * self.height, src_row_size)]
+                data = b''.join(rows).ljust(aligned_row_size * pixel_per_column, b'\x00')
+
+            if pixel_format == KHMigImageFormatFlag.INDEX4:
+                data = pack_nibbles(data)
+
+        if len(data) != stride * pixel_per_column:
+            raise Exception(f'Unexpected MIG pixel data size ({len(self.pixels)}) for a {self.width}x{self.height} image')
+
+        image_block_size = 0x50 + len(data)
+        picture_block_size = 0x10 + image_block_size
+        root_block_size = 0x10 + picture_block_size
+
+        br.write_bytes(b'00.1PSP\x00'.ljust(0xC, b'\x00'))
+
+        # Block ID, size, next block relative offset and data offset
+        # Blocks with children point to the first child as the next block
+        br.write_uint16([int(KHMigBlockFlag.ROOT_BLOCK), 0])
+        br.write_uint32([root_block_size, 0x10, 0x10])
+        br.write_uint16([int(KHMigBlockFlag.PICTURE_BLOCK), 0])
+        br.write_uint32([picture_block_size, 0x10, 0x10])
+        br.write_uint16([int(KHMigBlockFlag.IMAGE_BLOCK), 0])
+        br.write_uint32([image_block_size, image_block_size, 0x10])
+
+        # Header size, format, pixel order, dimensions, bits per pixel, alignment and dimension count
+        br.write_uint16([0x30, 0, int(pixel_format), 0, self.width, self.height,
+                         bit_per_pixel, width_align, height_align, 2])
+
+        # Index start, data start and data end offsets (relative to the header), and plane mask
+        br.write_uint32([0, 0x30, 0x40, 0x40 + len(data), 0])
+
+        # Level type and count, frame type and count, and frame offset
+        br.write_uint16([1, 1, 3, 1])
+        br.write_uint32([0x40, 0, 0, 0])
+
+        # The whole pixel block is written at once
+        br.write_bytes(data)
+
+    @classmethod
+    def skip(cls, br: BinaryReader):
+        br.seek(0xC, Whence.CUR)
+
+        # The root block contains all other blocks
+        root_start = br.pos()
+        br.seek(4, Whence.CUR)
+        br.seek(root_start + br.read_uint32(), Whence.BEGIN)
@@ -1,21 +1,34 @@
-from typing import List, Optional
-
-from mathutils import Euler, Vector
-
-from ..util import BinaryReader, BrStruct
-from .common import read_vector
-from .kh_enums import KHModeModelFlag, KHModeNodeFlag, KHModeVertexFlag
+from functools import lru_cache
+from itertools import chain
+from struct import Struct
+from typing import Callable, List, Optional, Tuple, Union
+
+from ..util import BinaryReader, BrStruct, Whence
+from .common import read_vector, read_view, require_numpy, write_vector
+from .kh_enums import KHModeModelFlag, KHModeNodeFlag, KHModeVertexFlag, has_flags
 from .khfile import KHFile, KHString
+from .vector import new_euler, new_vector
 
 
 class KHMode(KHFile):
     root_node: 'KHModeNode'
 
-    def __br_read__(self, br: BinaryReader):
-        self.root_node = br.read_struct(KHModeNode)
+    def __br_read__(self, br: BinaryReader, vertex_arrays=False, index_arrays=False, drop_degenerate=False):
+        """If vertex_arrays is True, mesh vertices will be read into a KHModeVertexBuffer instead of KHModeVertex objects.
+        If index_arrays is True, mesh faces will be read into an (n, 3) numpy array instead of a list of tuples.
+        If drop_degenerate is True, degenerate faces that come from triangle strips will be removed.
+        """
+        self.root_node = br.read_struct(KHModeNode, None, vertex_arrays, index_arrays, drop_degenerate)
+
+    def __br_write__(self, br: BinaryReader):
+        br.write_struct(self.root_node)
+
+    @classmethod
+    def skip(cls, br: BinaryReader):
+        KHModeNode.skip(br)
 
 
-def read_strips(br: BinaryReader, count):
+def read_strips(br: BinaryReader, count, drop_degenerate=False):
     faces = list()
 
     if count < 3:
@@ -30,8 +43,8 @@ def read_strips(br: BinaryReader, count):
         while True:
             f3 = next(strips)
 
-            # This does not filter degenerate faces
-            faces.append((f1, f3, f2) if change_dir else (f1, f2, f3))
+            if not drop_degenerate or (f1 != f2 and f2 != f3 and f1 != f3):
+                faces.append((f1, f3, f2) if change_dir else (f1, f2, f3))
 
             f1 = f2
             f2 = f3
@@ -43,11 +56,36 @@ def read_strips(br: BinaryReader, count):
     return faces
 
 
+def read_strips_array(br: BinaryReader, count, drop_degenerate=False) -> 'numpy.ndarray':
+    """Same as read_strips, but returns the faces as an (n, 3) uint16 array."""
+    np = require_numpy()
+
+    if count < 3:
+        raise Exception('Could not read strips - insufficient strip count')
+
+    strips = np.frombuffer(read_view(br, count * 2), '<u2')
+    faces = np.stack((strips[:-2], strips[1:-1], strips[2:]), axis=1).astype(np.uint16)
+
+    # Every other face has its winding flipped
+    faces[1::2, [1, 2]] = faces[1::2, [2, 1]]
+
+    if drop_degenerate:
+        faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])]
+
+    return faces
+
+
 class KHModeNode(BrStruct):
+    __slots__ = (
+        'meshes', 'flags', 'name', 'model_flags', 'is_clone', 'is_skinned', 'has_model', 'children', 'instance_scale',
+        'instance_rotation', 'instance_location', 'cloned_node_name', 'unk_float', 'unk_byte', 'bounding_box_points',
+        'material_name',
+    )
+
     meshes: Optional[List['KHModeMesh']]
 
-    def __br_read__(self, br: BinaryReader):
-        flags = KHModeNodeFlag(br.read_uint16())
+    def __br_read__(self, br: BinaryReader, *mesh_args):
+        self.flags = flags = KHModeNodeFlag(br.read_uint16())
         self.name: str = br.read_struct(KHString).data
 
         # Unsure what this does, but it does not affect the struct reading
@@ -56,7 +94,7 @@ class KHModeNode(BrStruct):
         self.is_clone = KHModeNodeFlag.CLONE in flags
         if self.is_clone:
             self.instance_scale = read_vector(br)
-            self.instance_rotation = Euler(read_vector(br)[:])
+            self.instance_rotation = new_euler(read_vector(br))
             self.instance_location = read_vector(br)
 
             self.cloned_node_name: str = br.read_struct(KHString).data
@@ -64,18 +102,97 @@ class KHModeNode(BrStruct):
         self.is_skinned = KHModeNodeFlag.UNSKINNED not in flags
         self.has_model = KHModeNodeFlag.SKINNED in flags or not self.is_skinned
         if self.has_model:
-            unk_float = br.read_float()
-            unk_byte = br.read_uint8()
+            self.unk_float = br.read_float()
+            self.unk_byte = br.read_uint8()
 
             self.bounding_box_points = read_vector(br, 2)
 
             mesh_count = br.read_uint16() if self.is_skinned else 1
-            self.meshes = br.read_struct(KHModeMesh, mesh_count, self.is_skinned)
+            self.meshes = br.read_struct(KHModeMesh, mesh_count, self.is_skinned, *mesh_args)
 
             self.material_name: str = br.read_struct(KHString).data
 
         child_count = br.read_uint16()
-        self.children = br.read_struct(KHModeNode, child_count)
+        self.children = br.read_struct(KHModeNode, child_count, *mesh_args)
+
+    def get_flags(self) -> KHModeNodeFlag:
+        """Returns the stored flags, updated to match is_clone, is_skinned and has_model. Other bits are kept."""
+        flags = int(getattr(self, 'flags', 0))
+
+        flags = (flags | KHModeNodeFlag.CLONE) if self.is_clone else (flags & ~KHModeNodeFlag.CLONE)
+
+        if not self.is_skinned:
+            if not self.has_model:
+                raise Exception(f'Unskinned node \"{self.name}\" should have a model')
+
+            flags |= KHModeNodeFlag.UNSKINNED
+        else:
+            if has_flags(flags, KHModeNodeFlag.UNSKINNED):
+                flags &= ~KHModeNodeFlag.UNSKINNED
+
+            flags = (flags | KHModeNodeFlag.SKINNED) if self.has_model else (flags & ~KHModeNodeFlag.SKINNED)
+
+        return KHModeNodeFlag(flags)
+
+    def __br_write__(self, br: BinaryReader):
+        # The flags decide which parts of the node are read, so they have to agree with what is written
+        self.flags = self.get_flags()
+
+        br.write_uint16(int(self.flags))
+        br.write_struct(KHString(), self.name)
+
+        br.write_uint32(int(self.model_flags))
+
+        if self.is_clone:
+            write_vector(br, self.instance_scale)
+            write_vector(br, self.instance_rotation)
+            write_vector(br, self.instance_location)
+
+            br.write_struct(KHString(), self.cloned_node_name)
+
+        if self.has_model:
+            br.write_float(self.unk_float)
+            br.write_uint8(self.unk_byte)
+
+            write_vector(br, self.bounding_box_points)
+
+            if self.is_skinned:
+                br.write_uint16(len(self.meshes))
+            elif len(self.meshes) != 1:
+                raise Exception(f'Unskinned node \"{self.name}\" should have exactly 1 mesh')
+
+            br.write_struct(self.meshes, self.is_skinned)
+
+            br.write_struct(KHString(), self.material_name)
+
+        br.write_uint16(len(self.children))
+        br.write_struct(self.children)
+
+    @staticmethod
+    def skip(br: BinaryReader):
+        flags = KHModeNodeFlag(br.read_uint16())
+        KHString.skip(br)
+
+        # Model flags
+        br.seek(4, Whence.CUR)
+
+        if KHModeNodeFlag.CLONE in flags:
+            # Instance transform and cloned node name
+            br.seek(0x24, Whence.CUR)
+            KHString.skip(br)
+
+        is_skinned = KHModeNodeFlag.UNSKINNED not in flags
+        if KHModeNodeFlag.SKINNED in flags or not is_skinned:
+            # Unknown float and byte, bounding box
+            br.seek(0x1D, Whence.CUR)
+
+            for _ in range(br.read_uint16() if is_skinned else 1):
+                KHModeMesh.skip(br, is_skinned)
+
+            KHString.skip(br)
+
+        for _ in range(br.read_uint16()):
+            KHModeNode.skip(br)
 
     def merge_meshes(self) -> 'KHModeMesh':
         if not self.has_model:
@@ -86,25 +203,61 @@ class KHModeNode(BrStruct):
         new_mesh.vertex_flags = 0
         new_mesh.bone_hashes = list()
         new_mesh.vertices = list()
+        new_mesh.vertex_buffer = None
         new_mesh.faces = list()
 
+        face_arrays = list()
+
         offset = 0
         for mesh in self.meshes:
             # Not sure if ORing the flags is a good idea, but they should generally be the same
             new_mesh.vertex_flags |= mesh.vertex_flags
             new_mesh.bone_hashes.extend(mesh.bone_hashes or [])
-            new_mesh.vertices.extend(mesh.vertices)
-            new_mesh.faces.extend(map(lambda f: tuple(map(lambda x: x + offset, f)), mesh.faces))
 
-            offset += len(mesh.vertices)
+            if isinstance(mesh.faces, list):
+                new_mesh.faces.extend(map(lambda f: tuple(map(lambda x: x + offset, f)), mesh.faces))
+            else:
+                face_arrays.append((mesh.faces, offset))
+
+            if mesh.vertex_buffer is not None:
+                offset += len(mesh.vertex_buffer)
+            else:
+                new_mesh.vertices.extend(mesh.vertices)
+                offset += len(mesh.vertices)
+
+        if self.meshes and self.meshes[0].vertex_buffer is not None:
+            new_mesh.vertices = None
+            new_mesh.vertex_buffer = KHModeVertexBuffer.concatenate([mesh.vertex_buffer for mesh in self.meshes])
+
+        if face_arrays:
+            np = require_numpy()
+
+            # The merged indices might not fit in 16 bits anymore
+            index_type = np.uint16 if offset <= 0x10000 else np.uint32
+            new_mesh.faces = np.concatenate([faces.astype(index_type) + index_type(face_offset)
+                                             for faces, face_offset in face_arrays])
 
         return new_mesh
 
 
 class KHModeMesh(BrStruct):
-    vertices: List['KHModeVertex']
+    __slots__ = ('faces', 'vertices', 'vertex_buffer', 'bone_hashes', 'vertex_flags')
+
+    # Either a list of tuples or an (n, 3) numpy array, depending on how the mesh was read
+    faces: Union[List[Tuple[int, int, int]], 'numpy.ndarray']
 
-    def __br_read__(self, br: BinaryReader, is_skinned):
+    # Only one of these is set, depending on how the mesh was read
+    vertices: Optional[List['KHModeVertex']]
+    vertex_buffer: Optional['KHModeVertexBuffer']
+
+    def __init__(self):
+        self.bone_hashes = None
+        self.faces = list()
+        self.vertex_flags = KHModeVertexFlag(0)
+        self.vertices = None
+        self.vertex_buffer = None
+
+    def __br_read__(self, br: BinaryReader, is_skinned, vertex_arrays=False, index_arrays=False, drop_degenerate=False):
         self.bone_hashes = None
 
         if is_skinned:
@@ -114,56 +267,356 @@ class KHModeMesh(BrStruct):
             self.bone_hashes = br.read_uint32(bone_count)
 
         triangle_count = br.read_uint16()
-        self.faces = list(map(lambda _: br.read_uint16(3), range(triangle_count)))
+        if index_arrays:
+            np = require_numpy()
+            self.faces = np.frombuffer(read_view(br, triangle_count * 6), '<u2').reshape(-1, 3).astype(np.uint16)
+        else:
+            self.faces = list(map(lambda _: br.read_uint16(3), range(triangle_count)))
 
         self.vertex_flags = KHModeVertexFlag(br.read_uint32())
         vertex_count = br.read_uint16()
-        self.vertices = br.read_struct(KHModeVertex, vertex_count, self.bone_hashes, self.vertex_flags)
+        if vertex_arrays:
+            self.vertices = None
+            self.vertex_buffer = br.read_struct(KHModeVertexBuffer, None, vertex_count, self.bone_hashes, self.vertex_flags)
+        else:
+            self.vertices = KHModeVertex.read_vertices(br, vertex_count, self.bone_hashes, self.vertex_flags)
+            self.vertex_buffer = None
 
         has_strips = br.read_uint16() != 0
 
         if has_strips:
             strip_count = br.read_uint16()
-            self.faces.extend(read_strips(br, strip_count))
+            if index_arrays:
+                self.faces = np.concatenate((self.faces, read_strips_array(br, strip_count, drop_degenerate)))
+            else:
+                self.faces.extend(read_strips(br, strip_count, drop_degenerate))
+
+    def __br_write__(self, br: BinaryReader, is_skinned):
+        """Faces that were read from triangle strips are written as normal triangles, so no strips are written."""
+        if is_skinned:
+            br.write_uint16(len(self.bone_hashes))
+            br.write_uint32(self.bone_hashes)
+
+        if len(self.faces) > 0xFFFF:
+            raise Exception(f'Too many faces in mesh ({len(self.faces)})')
+
+        # Each block is written at once
+        br.write_uint16(len(self.faces))
+        if isinstance(self.faces, list):
+            br.write_uint16(list(chain.from_iterable(self.faces)))
+        else:
+            br.write_bytes(self.faces.astype('<u2').tobytes())
+
+        br.write_uint32(int(self.vertex_flags))
+        if self.vertex_buffer is not None:
+            br.write_uint16(len(self.vertex_buffer))
+            br.write_struct(self.vertex_buffer, self.vertex_flags)
+        else:
+            vertex_struct = KHModeVertex.get_struct(self.vertex_flags)
+            vertices = self.vertices or ()
+
+            br.write_uint16(len(vertices))
+            br.write_bytes(b''.join(vertex_struct.pack(*vertex.get_values(self.vertex_flags)) for vertex in vertices))
+
+        # Strips
+        br.write_uint16(0)
+
+    @staticmethod
+    def skip(br: BinaryReader, is_skinned):
+        if is_skinned:
+            br.seek(br.read_uint16() * 4, Whence.CUR)
+
+        br.seek(br.read_uint16() * 6, Whence.CUR)
+
+        vertex_flags = KHModeVertexFlag(br.read_uint32())
+        br.seek(br.read_uint16() * KHModeVertex.get_size(vertex_flags), Whence.CUR)
+
+        if br.read_uint16() != 0:
+            br.seek(br.read_uint16() * 2, Whence.CUR)
 
 
 class KHModeVertex(BrStruct):
+    __slots__ = ('weights', 'bone_hashes', 'uv', 'color', 'normal', 'location')
+
+    @staticmethod
+    def get_layout(flags: KHModeVertexFlag) -> List[Tuple[str, str, int]]:
+        """Returns a (name, struct format character, count) tuple for each field of a vertex with the given flags.
+        Follows the same order and conditions as __br_read__.
+        """
+        layout = list()
+
+        if KHModeVertexFlag.HAS_WEIGHTS in flags:
+            weight_count = 1
+            if KHModeVertexFlag.HAS_4_WEIGHTS in flags:
+                weight_count += 4
+            if KHModeVertexFlag.HAS_2_WEIGHTS in flags:
+                weight_count += 2
+            if KHModeVertexFlag.HAS_1_WEIGHT in flags:
+                weight_count += 1
+
+            layout.append(('weights', 'f', weight_count))
+
+        if KHModeVertexFlag.HAS_UV_SHORT in flags:
+            layout.append(('uv', 'H', 2))
+        elif KHModeVertexFlag.HAS_UV_FLOAT in flags:
+            layout.append(('uv', 'f', 2))
+
+        if KHModeVertexFlag.HAS_COLOR_RGBA in flags:
+            layout.append(('color', 'B', 4))
+        elif KHModeVertexFlag.HAS_COLOR_UNK in flags:
+            layout.append(('color', 'H', 1))
+
+        if KHModeVertexFlag.HAS_NORMAL in flags:
+            layout.append(('normal', 'h', 3))
+
+            if KHModeVertexFlag.HAS_COLOR_UNK not in flags:
+                layout.append(('padding', 'h', 1))
+
+        if KHModeVertexFlag.HAS_LOCATION in flags:
+            layout.append(('location', 'f', 3))
+
+        return layout
+
+    @staticmethod
+    def get_size(flags: KHModeVertexFlag) -> int:
+        """Returns the size of a single vertex with the given flags."""
+        return KHModeVertex.get_struct(flags).size
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def get_struct(flags: KHModeVertexFlag) -> Struct:
+        """Returns a Struct for packing a single vertex with the given flags (see get_values).
+        Structs are created once for each flag value.
+        """
+        return Struct('<' + ''.join(f'{count}{fmt}' for _, fmt, count in KHModeVertex.get_layout(flags)))
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def get_decoder(flags: KHModeVertexFlag) -> Callable[['KHModeVertex', tuple], None]:
+        """Returns a function that sets the attributes of a vertex from the values of get_struct(flags).unpack().
+        Flags are only checked here, so decoders are created once for each flag value.
+        """
+        # Position of each field in the unpacked values
+        fields = dict()
+        start = 0
+        for name, _, count in KHModeVertex.get_layout(flags):
+            fields[name] = slice(start, start + count)
+            start += count
+
+        def none(values):
+            return None
+
+        get_weights = get_uv = get_color = get_normal = get_location = none
+
+        if (weights := fields.get('weights')) is not None:
+            def get_weights(values):
+                return values[weights]
+
+        if (uv := fields.get('uv')) is not None:
+            if KHModeVertexFlag.HAS_UV_SHORT in flags:
+                def get_uv(values, i=uv.start):
+                    return (values[i] / 0x7FFF, values[i + 1] / 0x7FFF)
+            else:
+                def get_uv(values):
+                    return values[uv]
+
+        if (color := fields.get('color')) is not None:
+            if KHModeVertexFlag.HAS_COLOR_RGBA in flags:
+                def get_color(values):
+                    return values[color]
+            else:
+                # NOTE: Unsure if this being read correctly
+                def get_color(values, i=color.start):
+                    c = values[i]
+                    return (((c >> 12) & 0xF) * 17, ((c >> 8) & 0xF) * 17, ((c >> 4) & 0xF) * 17, (c & 0xF) * 17)
+
+        if (normal := fields.get('normal')) is not None:
+            def get_normal(values, i=normal.start):
+                return new_vector((values[i] / 0x7FFF, values[i + 1] / 0x7FFF, values[i + 2] / 0x7FFF))
+
+        if (location := fields.get('location')) is not None:
+            def get_location(values):
+                return new_vector(values[location])
+
+        def decode(vertex: KHModeVertex, values: tuple):
+            vertex.weights = get_weights(values)
+            vertex.uv = get_uv(values)
+            vertex.color = get_color(values)
+            vertex.normal = get_normal(values)
+            vertex.location = get_location(values)
+
+        return decode
+
+    @staticmethod
+    def read_vertices(br: BinaryReader, count, bone_hashes, flags: KHModeVertexFlag) -> Tuple['KHModeVertex']:
+        """Reads count vertices at once, which is faster than reading each vertex with read_struct."""
+        vertex_struct = KHModeVertex.get_struct(flags)
+        decode = KHModeVertex.get_decoder(flags)
+        bone_hashes = tuple(bone_hashes) if bone_hashes else None
+
+        if vertex_struct.size == 0:
+            records = [()] * count
+        else:
+            records = vertex_struct.iter_unpack(read_view(br, count * vertex_struct.size))
+
+        vertices = list()
+        for values in records:
+            vertex = KHModeVertex()
+            vertex.bone_hashes = bone_hashes
+            decode(vertex, values)
+            vertices.append(vertex)
+
+        return tuple(vertices)
+
     def __br_read__(self, br: BinaryReader, bone_hashes, flags: KHModeVertexFlag):
-        weight_count = 1
-        if KHModeVertexFlag.HAS_4_WEIGHTS in flags:
-            weight_count += 4
-        if KHModeVertexFlag.HAS_2_WEIGHTS in flags:
-            weight_count += 2
-        if KHModeVertexFlag.HAS_1_WEIGHT in flags:
-            weight_count += 1
-
-        self.weights = br.read_float(weight_count) if KHModeVertexFlag.HAS_WEIGHTS in flags else None
+        vertex_struct = KHModeVertex.get_struct(flags)
+
         self.bone_hashes = tuple(bone_hashes) if bone_hashes else None
+        KHModeVertex.get_decoder(flags)(self, vertex_struct.unpack(read_view(br, vertex_struct.size)))
+
+    def get_values(self, flags: KHModeVertexFlag) -> list:
+        """Returns the values of the fields of this vertex as they are stored, in the same order as get_layout."""
+        values = list()
+
+        if KHModeVertexFlag.HAS_WEIGHTS in flags:
+            values.extend(self.weights)
 
-        self.uv = None
         if KHModeVertexFlag.HAS_UV_SHORT in flags:
-            self.uv = tuple(map(lambda x: float(x) / 0x7FFF, br.read_uint16(2)))
+            values.extend(round(x * 0x7FFF) for x in self.uv)
         elif KHModeVertexFlag.HAS_UV_FLOAT in flags:
-            self.uv = br.read_float(2)
+            values.extend(self.uv)
 
-        self.color = None
         if KHModeVertexFlag.HAS_COLOR_RGBA in flags:
-            self.color = br.read_uint8(4)
+            values.extend(self.color)
         elif KHModeVertexFlag.HAS_COLOR_UNK in flags:
-            # NOTE: Unsure if this being read correctly
-            color = br.read_uint16()
-            color = ((color >> 12) & 0xF, (color >> 8) & 0xF, (color >> 4) & 0xF, color & 0xF)
-            self.color = tuple(map(lambda c: c * 17, color))
-
-            # # Just skip color since we don't know how it's read
-            # br.read_uint16()
+            r, g, b, a = (round(c / 17) for c in self.color)
+            values.append((r << 12) | (g << 8) | (b << 4) | a)
 
-        self.normal = None
         if KHModeVertexFlag.HAS_NORMAL in flags:
-            self.normal = Vector(tuple(map(lambda x: float(x) / 0x7FFF, br.read_int16(3))))
+            values.extend(round(x * 0x7FFF) for x in self.normal[:3])
 
             if KHModeVertexFlag.HAS_COLOR_UNK not in flags:
                 # Padding
-                br.read_int16()
+                values.append(0)
+
+        if KHModeVertexFlag.HAS_LOCATION in flags:
+            values.extend(self.location[:3])
+
+        return values
+
+    def __br_write__(self, br: BinaryReader, flags: KHModeVertexFlag):
+        br.write_bytes(KHModeVertex.get_struct(flags).pack(*self.get_values(flags)))
+
+
+class KHModeVertexBuffer(BrStruct):
+    """Stores the vertices of a mesh as one numpy array per attribute, instead of one KHModeVertex per vertex.
+    Each array has one row per vertex, and attributes that the vertices do not have are None.
+    """
+    __slots__ = ('bone_hashes', 'weights', 'uv', 'color', 'normal', 'location', 'count')
+
+    bone_hashes: Optional[Tuple[int]]
+
+    weights: Optional['numpy.ndarray']
+    uv: Optional['numpy.ndarray']
+    color: Optional['numpy.ndarray']
+    normal: Optional['numpy.ndarray']
+    location: Optional['numpy.ndarray']
+
+    def __init__(self):
+        self.count = 0
+        self.bone_hashes = None
+
+        self.weights = None
+        self.uv = None
+        self.color = None
+        self.normal = None
+        self.location = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __br_read__(self, br: BinaryReader, count, bone_hashes, flags: KHModeVertexFlag):
+        np = require_numpy()
+
+        self.count = count
+        self.bone_hashes = tuple(bone_hashes) if bone_hashes else None
+
+        dtype = np.dtype([(name, '<' + fmt, (field_count,)) for name, fmt, field_count in KHModeVertex.get_layout(flags)])
+        if dtype.itemsize == 0:
+            return
+
+        # The whole vertex block is decoded at once, and each attribute is copied out of it (no references to br are kept)
+        data = np.frombuffer(read_view(br, count * dtype.itemsize), dtype, count)
+
+        if 'weights' in dtype.names:
+            self.weights = data['weights'].astype(np.float32)
+
+        if 'uv' in dtype.names:
+            self.uv = data['uv'].astype(np.float32)
+            if KHModeVertexFlag.HAS_UV_SHORT in flags:
+                self.uv /= 0x7FFF
+
+        if KHModeVertexFlag.HAS_COLOR_RGBA in flags:
+            self.color = data['color'].astype(np.uint8)
+        elif KHModeVertexFlag.HAS_COLOR_UNK in flags:
+            # NOTE: Unsure if this being read correctly (same as KHModeVertex)
+            color = data['color'][:, 0]
+            self.color = (np.stack([color >> 12, color >> 8, color >> 4, color], axis=1) & 0xF).astype(np.uint8) * 17
+
+        if 'normal' in dtype.names:
+            self.normal = data['normal'].astype(np.float32) / 0x7FFF
+
+        if 'location' in dtype.names:
+            self.location = data['location'].astype(np.float32)
+
+    def __br_write__(self, br: BinaryReader, flags: KHModeVertexFlag):
+        np = require_numpy()
+
+        dtype = np.dtype([(name, '<' + fmt, (field_count,)) for name, fmt, field_count in KHModeVertex.get_layout(flags)])
+        if dtype.itemsize == 0:
+            return
+
+        # Fill in all attributes, then write the whole vertex block at once
+        data = np.zeros(self.count, dtype)
+
+        if 'weights' in dtype.names:
+            data['weights'] = self.weights
+
+        if KHModeVertexFlag.HAS_UV_SHORT in flags:
+            data['uv'] = np.round(self.uv * 0x7FFF)
+        elif 'uv' in dtype.names:
+            data['uv'] = self.uv
+
+        if KHModeVertexFlag.HAS_COLOR_RGBA in flags:
+            data['color'] = self.color
+        elif KHModeVertexFlag.HAS_COLOR_UNK in flags:
+            color = np.round(self.color / 17).astype(np.uint16)
+            data['color'][:, 0] = (color[:, 0] << 12) | (color[:, 1] << 8) | (color[:, 2] << 4) | color[:, 3]
+
+        if 'normal' in dtype.names:
+            data['normal'] = np.round(self.normal * 0x7FFF)
+
+        if 'location' in dtype.names:
+            data['location'] = self.location
+
+        br.write_bytes(data.tobytes())
+
+    @staticmethod
+    def concatenate(buffers: List['KHModeVertexBuffer']) -> 'KHModeVertexBuffer':
+        """Joins the given buffers into one. Attributes that are missing from any of the buffers will be None.
+        Bone hashes are not kept, as the weights of each buffer refer to its own mesh's bones.
+        """
+        np = require_numpy()
+
+        result = KHModeVertexBuffer()
+        result.count = sum(map(len, buffers))
+
+        for name in ('weights', 'uv', 'color', 'normal', 'location'):
+            arrays = [getattr(buffer, name) for buffer in buffers]
+
+            if arrays and all(array is not None for array in arrays):
+                # Weight counts might differ between buffers, which concatenate does not allow
+                if len(set(array.shape[1] for array in arrays)) == 1:
+                    setattr(result, name, np.concatenate(arrays))
 
-        self.location = read_vector(br) if KHModeVertexFlag.HAS_LOCATION in flags else None
+        return result
@@ -1,11 +1,20 @@
-from typing import List, Tuple
-
-from mathutils import Vector, Euler
-
-from ..util import BinaryReader, BrStruct
-from .common import read_short_float, read_short_float_vector, read_vector, write_short_float, write_short_float_vector, write_vector
-from .kh_enums import KHPoseChannelFlag, KHPoseFlag
+import math
+import sys
+from array import array
+from functools import lru_cache
+from struct import Struct
+from typing import List, Optional, Sequence, Tuple, Union
+
+from ..util import BinaryReader, BrStruct, Whence
+from .common import (read_short_float, read_short_float_vector, read_vector, read_view, write_short_float,
+                     write_short_float_vector, write_vector)
+from .kh_enums import KHPoseChannelFlag, KHPoseFlag, count_flags, has_flags
 from .khfile import KHFile, KHString
+from .vector import Euler, Vector, new_euler
+
+# Value and frame of a single keyframe
+KEYFRAME_SHORT_STRUCT = Struct('<hH')
+KEYFRAME_FLOAT_STRUCT = Struct('<ff')
 
 
 class KHPose(KHFile):
@@ -17,7 +26,8 @@ class KHPose(KHFile):
 
     bones: List['KHPoseBone']
 
-    def __br_read__(self, br: BinaryReader):
+    def __br_read__(self, br: BinaryReader, keyframe_arrays=False):
+        """If keyframe_arrays is True, channels will be read as KHPoseChannelArray instead of KHPoseChannel."""
         self.name: str = br.read_struct(KHString).data
 
         self.pose_flags = KHPoseFlag(br.read_uint16())
@@ -26,47 +36,122 @@ class KHPose(KHFile):
         data_size = br.read_uint32()
         self.end_frame = br.read_float()
 
-        self.bones = br.read_struct(KHPoseBone, bone_count, self.pose_flags)
+        self.bones = br.read_struct(KHPoseBone, bone_count, self.pose_flags, keyframe_arrays)
 
-    def __br_write__(self, br: BinaryReader):
+    @classmethod
+    def skip(cls, br: BinaryReader):
+        KHString.skip(br)
+
+        pose_flags = KHPoseFlag(br.read_uint16())
+        bone_count = br.read_uint16()
+
+        # Data size and end frame
+        br.seek(8, Whence.CUR)
+
+        vector_size, keyframe_size = (6, 4) if KHPoseFlag.SHORT_FLOATS in pose_flags else (12, 8)
+        for _ in range(bone_count):
+            # Flags, name, initial values, bone flags
+            br.seek(2, Whence.CUR)
+            KHString.skip(br)
+            br.seek(vector_size * 3 + 4, Whence.CUR)
+
+            for _ in range(count_flags(br.read_uint16())):
+                br.seek(br.read_uint32() * keyframe_size, Whence.CUR)
+
+    def get_channels(self) -> List[Union['KHPoseChannel', 'KHPoseChannelArray']]:
+        return [c for b in self.bones
+                for c in (b.camera_fov, b.camera_roll, *b.camera_focus, *b.scale, *b.rotation, *b.location) if c is not None]
+
+    def get_short_float_error(self) -> Optional[float]:
+        """Returns the largest error that storing the pose with KHPoseFlag.SHORT_FLOATS would cause,
+        or None if some values or frames cannot be stored that way.
+        """
+        values = list()
+        for b in self.bones:
+            values.extend((*b.initial_scale[:3], *b.initial_rotation[:3], *b.initial_location[:3]))
+
+        for c in self.get_channels():
+            frames, channel_values = c.get_frames_and_values()
+
+            # Frames are stored as unsigned shorts
+            if not all(frame == int(frame) and 0 <= frame <= 0xFFFF for frame in frames):
+                return None
+
+            values.extend(channel_values)
+
+        error = 0.0
+        for value in values:
+            if not -0x8000 <= (short := round(value * 1023)) <= 0x7FFF:
+                return None
+
+            error = max(error, abs(short / 1023 - value))
+
+        return error
+
+    def __br_write__(self, br: BinaryReader, tolerance: float = None):
+        """If tolerance is given, keyframes that can be interpolated from the keyframes around them are not written,
+        and KHPoseFlag.SHORT_FLOATS is used if the values can be stored as short floats.
+        Written values will be within tolerance of the original ones. The pose itself is not modified.
+        """
         br.write_struct(KHString(), self.name)
 
         # Setup flags
-        # KHPoseFlag.SHORT_FLOATS is not used as it would require a different calculation for data_size
-        self.pose_flags = KHPoseFlag.POSE
+        pose_flags = KHPoseFlag.POSE
         if len(self.bones) == 1 and self.bones[0].is_camera():
-            self.pose_flags |= KHPoseFlag.CAMERA
+            pose_flags |= KHPoseFlag.CAMERA
+
+        if tolerance is not None and (error := self.get_short_float_error()) is not None and error <= tolerance:
+            pose_flags |= KHPoseFlag.SHORT_FLOATS
 
-        br.write_uint16(self.pose_flags)
+            # Keyframes are removed before being quantized, so both errors add up
+            tolerance -= error
+
+        self.set_computed('pose_flags', pose_flags)
+
+        br.write_uint16(int(self.pose_flags))
         br.write_uint16(len(self.bones))
 
         # Calculate end frame
-        self.end_frame = 0
+        end_frame = 0
         for b in self.bones:
             for c in (b.camera_fov, b.camera_roll, *b.camera_focus, *b.scale, *b.rotation, *b.location):
-                if c and c.keyframes:
-                    self.end_frame = max(self.end_frame, c.keyframes[-1].frame)
+                if c is not None and (channel_end_frame := c.get_end_frame()) is not None:
+                    end_frame = max(end_frame, channel_end_frame)
+
+        self.set_computed('end_frame', end_frame)
 
         # Data size
         data_size_pos = br.pos()
         br.write_uint32(0)
         br.write_float(self.end_frame)
 
-        br.write_struct(self.bones, self.pose_flags)
+        br.write_struct(self.bones, self.pose_flags, tolerance)
 
         # Size of data for allocation purposes
         # Equals size of all nodes without the KHString structs (length + string)
-        # If KHPoseFlag.SHORT_FLOATS is used, then (possibly) each short float should count as a normal float (4 bytes)
         data_size = br.pos() - (data_size_pos + 8)
 
         for bone in self.bones:
             data_size -= 2 + len(bone.name)
 
+        if KHPoseFlag.SHORT_FLOATS in self.pose_flags:
+            # Short floats are converted to normal floats when loaded, so the size is the same as the float layout's
+            # Each bone has 9 initial values, and each keyframe has a value and a frame
+            channel_count = sum(count_flags(bone.channel_flags) for bone in self.bones)
+            keyframe_count = (data_size - len(self.bones) * 26 - channel_count * 4) // 4
+
+            data_size += len(self.bones) * 9 * 2 + keyframe_count * 4
+
         with br.seek_to(data_size_pos):
             br.write_uint32(data_size)
 
 
 class KHPoseBone(BrStruct):
+    __slots__ = (
+        'name', 'initial_scale', 'initial_rotation', 'initial_location', 'channel_flags', 'scale', 'rotation',
+        'location', 'camera_roll', 'camera_fov', 'camera_focus',
+    )
+
     name: str
     initial_scale: Vector
     initial_rotation: Euler
@@ -75,6 +160,7 @@ class KHPoseBone(BrStruct):
     # Gets overridden when writing
     channel_flags: KHPoseChannelFlag
 
+    # Each channel is either a KHPoseChannel or a KHPoseChannelArray, depending on how the pose was read
     scale: List['KHPoseChannel']
     rotation: List['KHPoseChannel']
     location: List['KHPoseChannel']
@@ -93,44 +179,74 @@ class KHPoseBone(BrStruct):
         self.camera_focus = [None] * 3
 
     def is_camera(self):
-        return self.camera_roll or self.camera_fov or (self.camera_focus and any(self.camera_focus))
+        # Channels are compared with None, as empty KHPoseChannelArray objects are falsy
+        return (self.camera_roll is not None or self.camera_fov is not None
+                or (self.camera_focus is not None and any(c is not None for c in self.camera_focus)))
 
-    def __br_read__(self, br: BinaryReader, pose_flags: KHPoseFlag):
+    def __br_read__(self, br: BinaryReader, pose_flags: KHPoseFlag, keyframe_arrays=False):
         flags = br.read_uint16()
         self.name = br.read_struct(KHString).data
 
-        read_vector_func = read_short_float_vector if KHPoseFlag.SHORT_FLOATS in pose_flags else read_vector
+        read_vector_func = read_short_float_vector if has_flags(pose_flags, KHPoseFlag.SHORT_FLOATS) else read_vector
 
         # Rotation is euler in radians
         self.initial_scale = read_vector_func(br)
-        self.initial_rotation = Euler(read_vector_func(br)[:])
+        self.initial_rotation = new_euler(read_vector_func(br))
         self.initial_location = read_vector_func(br)
 
         pose_bone_flags = br.read_uint32()
-        self.channel_flags = KHPoseChannelFlag(br.read_uint16())
-
-        channels = list(br.read_struct(KHPoseChannel, len(self.channel_flags), pose_flags))
-
-        if KHPoseFlag.CAMERA in pose_flags:
-            self.camera_roll = channels.pop(0) if KHPoseChannelFlag.CAMERA_ROLL in self.channel_flags else None
-            self.camera_fov = channels.pop(0) if KHPoseChannelFlag.CAMERA_FOV in self.channel_flags else None
+        channel_flags = br.read_uint16()
+        self.channel_flags = KHPoseChannelFlag(channel_flags)
+
+        channel_type = KHPoseChannelArray if keyframe_arrays else KHPoseChannel
+        channels = br.read_struct(channel_type, count_flags(channel_flags), pose_flags)
+
+        # The plain int flags are used for the lookups, as they are faster to hash and compare
+        targets = KHPoseBone.get_channel_targets(channel_flags, has_flags(pose_flags, KHPoseFlag.CAMERA))
+        for (name, index), channel in zip(targets, channels):
+            if name is None:
+                continue
+            elif index is None:
+                setattr(self, name, channel)
+            else:
+                getattr(self, name)[index] = channel
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def get_channel_targets(channel_flags: int, is_camera: bool) -> Tuple[Tuple[str, Optional[int]], ...]:
+        """Returns the (attribute name, index) that each channel is stored in, in the order that the channels are read.
+        The index is None for attributes that are a single channel, and the name is None for channels that are not kept.
+        Created once for each flag value.
+        """
+        targets = list()
+
+        def add_targets(name, flags):
+            for i, flag in enumerate(flags):
+                if has_flags(channel_flags, flag):
+                    targets.append((name, i))
+
+        if is_camera:
+            if has_flags(channel_flags, KHPoseChannelFlag.CAMERA_ROLL):
+                targets.append(('camera_roll', None))
+            if has_flags(channel_flags, KHPoseChannelFlag.CAMERA_FOV):
+                targets.append(('camera_fov', None))
 
             # Might be unused, but let's check for it just in case
-            camera_unk2 = channels.pop(0) if KHPoseChannelFlag.CAMERA_UNK in self.channel_flags else None
+            if has_flags(channel_flags, KHPoseChannelFlag.CAMERA_UNK):
+                targets.append((None, None))
 
-            for i, channel in enumerate((KHPoseChannelFlag.FOCUS_X, KHPoseChannelFlag.FOCUS_Y, KHPoseChannelFlag.FOCUS_Z)):
-                self.camera_focus[i] = (channels.pop(0) if channel in self.channel_flags else None)
+            add_targets('camera_focus', (KHPoseChannelFlag.FOCUS_X, KHPoseChannelFlag.FOCUS_Y, KHPoseChannelFlag.FOCUS_Z))
         else:
-            for i, channel in enumerate((KHPoseChannelFlag.SCALE_X, KHPoseChannelFlag.SCALE_Y, KHPoseChannelFlag.SCALE_Z)):
-                self.scale[i] = (channels.pop(0) if channel in self.channel_flags else None)
+            add_targets('scale', (KHPoseChannelFlag.SCALE_X, KHPoseChannelFlag.SCALE_Y, KHPoseChannelFlag.SCALE_Z))
+            add_targets('rotation', (KHPoseChannelFlag.ROTATION_X,
+                        KHPoseChannelFlag.ROTATION_Y, KHPoseChannelFlag.ROTATION_Z))
 
-            for i, channel in enumerate((KHPoseChannelFlag.ROTATION_X, KHPoseChannelFlag.ROTATION_Y, KHPoseChannelFlag.ROTATION_Z)):
-                self.rotation[i] = (channels.pop(0) if channel in self.channel_flags else None)
+        add_targets('location', (KHPoseChannelFlag.LOCATION_X, KHPoseChannelFlag.LOCATION_Y, KHPoseChannelFlag.LOCATION_Z))
 
-        for i, channel in enumerate((KHPoseChannelFlag.LOCATION_X, KHPoseChannelFlag.LOCATION_Y, KHPoseChannelFlag.LOCATION_Z)):
-            self.location[i] = (channels.pop(0) if channel in self.channel_flags else None)
+        return tuple(targets)
 
-    def __br_write__(self, br: BinaryReader, pose_flags: KHPoseFlag):
+    def __br_write__(self, br: BinaryReader, pose_flags: KHPoseFlag, tolerance: float = None):
+        """If tolerance is given, redundant keyframes are removed (see reduce_channel)."""
         # flags
         br.write_uint16(0x0602)
         br.write_struct(KHString(), self.name)
@@ -138,7 +254,7 @@ class KHPoseBone(BrStruct):
         write_vector_func = write_short_float_vector if KHPoseFlag.SHORT_FLOATS in pose_flags else write_vector
 
         write_vector_func(br, self.initial_scale)
-        write_vector_func(br, Vector(self.initial_rotation))
+        write_vector_func(br, self.initial_rotation)
         write_vector_func(br, self.initial_location)
 
         channels = list()
@@ -147,15 +263,15 @@ class KHPoseBone(BrStruct):
 
         def add_channels(channel_list, channel_flags):
             for i, channel in enumerate(channel_list):
-                if channel:
+                if channel is not None:
                     channels.append(channel)
                     self.channel_flags |= channel_flags[i]
 
         if KHPoseFlag.CAMERA in pose_flags:
-            if self.camera_roll:
+            if self.camera_roll is not None:
                 channels.append(self.camera_roll)
                 self.channel_flags |= KHPoseChannelFlag.CAMERA_ROLL
-            if self.camera_fov:
+            if self.camera_fov is not None:
                 channels.append(self.camera_fov)
                 self.channel_flags |= KHPoseChannelFlag.CAMERA_FOV
 
@@ -172,12 +288,17 @@ class KHPoseBone(BrStruct):
                      KHPoseChannelFlag.LOCATION_Y, KHPoseChannelFlag.LOCATION_Z))
 
         br.write_uint32(2 if (self.channel_flags != 0) else 0)
-        br.write_uint16(self.channel_flags)
+        br.write_uint16(int(self.channel_flags))
+
+        if tolerance is not None:
+            channels = [reduce_channel(c, tolerance) for c in channels]
 
         br.write_struct(channels, pose_flags)
 
 
 class KHPoseChannel(BrStruct):
+    __slots__ = ('keyframes',)
+
     keyframes: List['KHPoseKeyframe']
 
     def __init__(self):
@@ -185,8 +306,21 @@ class KHPoseChannel(BrStruct):
 
     def __br_read__(self, br: BinaryReader, pose_flags: KHPoseFlag):
         count = br.read_uint32()
-        self.keyframes = list(br.read_struct(
-            KHPoseKeyframeShort if KHPoseFlag.SHORT_FLOATS in pose_flags else KHPoseKeyframeFloat, count))
+
+        # All keyframes are unpacked at once (same as KHPoseKeyframeShort/KHPoseKeyframeFloat.__br_read__)
+        self.keyframes = list()
+        if KHPoseFlag.SHORT_FLOATS in pose_flags:
+            for value, frame in KEYFRAME_SHORT_STRUCT.iter_unpack(read_view(br, count * KEYFRAME_SHORT_STRUCT.size)):
+                kf = KHPoseKeyframeShort()
+                kf.value = value / 1023.0
+                kf.frame = frame
+                self.keyframes.append(kf)
+        else:
+            for value, frame in KEYFRAME_FLOAT_STRUCT.iter_unpack(read_view(br, count * KEYFRAME_FLOAT_STRUCT.size)):
+                kf = KHPoseKeyframeFloat()
+                kf.value = value
+                kf.frame = frame
+                self.keyframes.append(kf)
 
     def __br_write__(self, br: BinaryReader, pose_flags: KHPoseFlag):
         br.write_uint32(len(self.keyframes))
@@ -194,8 +328,159 @@ class KHPoseChannel(BrStruct):
             br.write_struct(KHPoseKeyframeShort(
                 kf) if KHPoseFlag.SHORT_FLOATS in pose_flags else KHPoseKeyframeFloat(kf))
 
+    def get_end_frame(self) -> Optional[float]:
+        return self.keyframes[-1].frame if self.keyframes else None
+
+    def get_frames_and_values(self) -> Tuple[List[float], List[float]]:
+        return [kf.frame for kf in self.keyframes], [kf.value for kf in self.keyframes]
+
+
+class KHPoseChannelArray(BrStruct):
+    """Same as KHPoseChannel, but the frames and values of the keyframes are stored in two float arrays
+    instead of one object per keyframe. All keyframes are read and written at once.
+    """
+    __slots__ = ('frames', 'values')
+
+    frames: array
+    values: array
+
+    def __init__(self):
+        self.frames = array('f')
+        self.values = array('f')
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    @property
+    def keyframes(self) -> List['KHPoseKeyframe']:
+        """Keyframe objects created from the arrays. Modifying them does not change the channel."""
+        keyframes = list()
+        for frame, value in zip(self.frames, self.values):
+            kf = KHPoseKeyframe()
+            kf.frame = frame
+            kf.value = value
+            keyframes.append(kf)
+
+        return keyframes
+
+    @keyframes.setter
+    def keyframes(self, keyframes: List['KHPoseKeyframe']):
+        self.frames = array('f', [kf.frame for kf in keyframes])
+        self.values = array('f', [kf.value for kf in keyframes])
+
+    def get_end_frame(self) -> Optional[float]:
+        return self.frames[-1] if self.frames else None
+
+    def get_frames_and_values(self) -> Tuple[array, array]:
+        return self.frames, self.values
+
+    def __br_read__(self, br: BinaryReader, pose_flags: KHPoseFlag):
+        count = br.read_uint32()
+
+        if KHPoseFlag.SHORT_FLOATS in pose_flags:
+            # Each keyframe is a signed short value followed by an unsigned short frame
+            data = read_view(br, count * 4)
+            values, frames = array('h'), array('H')
+            values.frombytes(data)
+            frames.frombytes(data)
+
+            if sys.byteorder == 'big':
+                values.byteswap()
+                frames.byteswap()
+
+            self.values = array('f', [x / 1023.0 for x in values[0::2]])
+            self.frames = array('f', frames[1::2])
+        else:
+            data = array('f')
+            data.frombytes(read_view(br, count * 8))
+
+            if sys.byteorder == 'big':
+                data.byteswap()
+
+            self.values = data[0::2]
+            self.frames = data[1::2]
+
+    def __br_write__(self, br: BinaryReader, pose_flags: KHPoseFlag):
+        if len(self.frames) != len(self.values):
+            raise Exception('Pose channel should have the same number of frames and values')
+
+        br.write_uint32(len(self.frames))
+
+        if KHPoseFlag.SHORT_FLOATS in pose_flags:
+            data = array('H', bytes(len(self.frames) * 4))
+            data[0::2] = array('H', [round(x * 1023) & 0xFFFF for x in self.values])
+            data[1::2] = array('H', map(int, self.frames))
+        else:
+            data = array('f', bytes(len(self.frames) * 8))
+            data[0::2] = self.values
+            data[1::2] = self.frames
+
+        if sys.byteorder == 'big':
+            data.byteswap()
+
+        br.write_bytes(data.tobytes())
+
+
+def reduce_keyframes(frames: Sequence[float], values: Sequence[float], tolerance: float) -> List[int]:
+    """Returns the indices of the keyframes that have to be kept so that linear interpolation between them stays within
+    tolerance of all the original keyframes. The first and last keyframes are always kept.
+    """
+    count = len(frames)
+    if count <= 2:
+        return list(range(count))
+
+    keep = [0]
+    start = 0
+
+    # Range of slopes from the start keyframe that pass within tolerance of all keyframes after it
+    low, high = -math.inf, math.inf
+
+    for i in range(1, count):
+        if frames[i] <= frames[i - 1]:
+            # Keyframes on the same frame (or out of order) cannot be interpolated, so keep both
+            if keep[-1] != i - 1:
+                keep.append(i - 1)
+            keep.append(i)
+
+            start = i
+            low, high = -math.inf, math.inf
+            continue
+
+        duration = frames[i] - frames[start]
+        if not low <= (values[i] - values[start]) / duration <= high:
+            # A line to this keyframe would skip past one of the previous keyframes, so the one before it is needed
+            start = i - 1
+            keep.append(start)
+
+            low, high = -math.inf, math.inf
+            duration = frames[i] - frames[start]
+
+        low = max(low, (values[i] - tolerance - values[start]) / duration)
+        high = min(high, (values[i] + tolerance - values[start]) / duration)
+
+    if keep[-1] != count - 1:
+        keep.append(count - 1)
+
+    return keep
+
+
+def reduce_channel(channel: Union[KHPoseChannel, KHPoseChannelArray], tolerance: float) -> KHPoseChannelArray:
+    """Returns a copy of the channel without the keyframes that lie within tolerance of the line between the keyframes
+    around them. Constant and linear runs of keyframes are reduced to their first and last keyframes.
+    """
+    frames, values = channel.get_frames_and_values()
+    keep = reduce_keyframes(frames, values, tolerance)
+
+    result = KHPoseChannelArray()
+    result.frames = array('f', [frames[i] for i in keep])
+    result.values = array('f', [values[i] for i in keep])
+
+    return result
+
 
 class KHPoseKeyframe(BrStruct):
+    __slots__ = ('frame', 'value')
+
     frame: float
     value: float
 
@@ -206,16 +491,20 @@ class KHPoseKeyframe(BrStruct):
 
 
 class KHPoseKeyframeShort(KHPoseKeyframe):
+    __slots__ = ()
+
     def __br_read__(self, br: BinaryReader):
         self.value = read_short_float(br)
         self.frame = br.read_uint16()
 
     def __br_write__(self, br: BinaryReader):
         write_short_float(br, self.value)
-        br.write_uint16(self.frame)
+        br.write_uint16(int(self.frame))
 
 
 class KHPoseKeyframeFloat(KHPoseKeyframe):
+    __slots__ = ()
+
     def __br_read__(self, br: BinaryReader):
         self.value, self.frame = br.read_float(2)
 
@@ -1,6 +1,6 @@
 from typing import List
 
-from ..util import BinaryReader, BrStruct
+from ..util import BinaryReader, BrStruct, Whence
 from .khfile import KHFile, KHString
 
 
@@ -8,12 +8,26 @@ class KHSkel(KHFile):
     def __br_read__(self, br: BinaryReader):
         self.root_bone: KHSkelBone = br.read_struct(KHSkelBone)
 
+    def __br_write__(self, br: BinaryReader):
+        br.write_struct(self.root_bone)
+
+    @classmethod
+    def skip(cls, br: BinaryReader):
+        KHSkelBone.skip(br)
+
 
 class KHSkelBone(BrStruct):
+    __slots__ = ('children', 'flags', 'name')
+
     children: List['KHSkelBone']
 
+    def __init__(self):
+        # Unknown, kept from the file when reading
+        self.flags = 0
+        self.children = list()
+
     def __br_read__(self, br: BinaryReader):
-        flags = br.read_uint16()
+        self.flags = br.read_uint16()
         self.name: str = br.read_struct(KHString).data
 
         value_count = br.read_uint32()
@@ -23,3 +37,23 @@ class KHSkelBone(BrStruct):
 
         child_count = br.read_uint16()
         self.children = br.read_struct(KHSkelBone, child_count)
+
+    def __br_write__(self, br: BinaryReader):
+        br.write_uint16(self.flags)
+        br.write_struct(KHString(), self.name)
+
+        # Value count
+        br.write_uint32(1)
+
+        br.write_uint16(len(self.children))
+        br.write_struct(self.children)
+
+    @staticmethod
+    def skip(br: BinaryReader):
+        # Flags, name, value count
+        br.seek(2, Whence.CUR)
+        KHString.skip(br)
+        br.seek(4, Whence.CUR)
+
+        for _ in range(br.read_uint16()):
+            KHSkelBone.skip(br)
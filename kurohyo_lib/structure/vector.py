@@ -0,0 +1,110 @@
+import copyreg
+from typing import Iterable
+
+# Name of the current backend (see set_vector_backend)
+_backend = 'tuple'
+
+
+class Vector(tuple):
+    """Lightweight 3D vector, used when mathutils is not needed. Supports the parts of mathutils.Vector that are used
+    by kurohyo_lib, and arithmetic works per component (instead of the tuple behavior).
+    """
+    __slots__ = ()
+
+    def __new__(cls, values: Iterable[float] = (0.0, 0.0, 0.0)):
+        return tuple.__new__(cls, values)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({tuple.__repr__(self)})'
+
+    @property
+    def x(self) -> float:
+        return self[0]
+
+    @property
+    def y(self) -> float:
+        return self[1]
+
+    @property
+    def z(self) -> float:
+        return self[2]
+
+    @property
+    def xyz(self) -> 'Vector':
+        return Vector(self[:3])
+
+    def __add__(self, other):
+        return type(self)(a + b for a, b in zip(self, other))
+
+    def __sub__(self, other):
+        return type(self)(a - b for a, b in zip(self, other))
+
+    def __mul__(self, scalar):
+        return type(self)(a * scalar for a in self)
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return type(self)(-a for a in self)
+
+    def dot(self, other) -> float:
+        return sum(a * b for a, b in zip(self, other))
+
+    def cross(self, other) -> 'Vector':
+        return Vector((self[1] * other[2] - self[2] * other[1],
+                       self[2] * other[0] - self[0] * other[2],
+                       self[0] * other[1] - self[1] * other[0]))
+
+
+class Euler(Vector):
+    """Rotation in radians. Only the XYZ order is used by the game."""
+    __slots__ = ()
+
+    order = 'XYZ'
+
+    def __new__(cls, angles: Iterable[float] = (0.0, 0.0, 0.0), order='XYZ'):
+        return tuple.__new__(cls, angles)
+
+
+vector_type = Vector
+euler_type = Euler
+
+
+def new_vector(values: Iterable[float]):
+    """Creates a vector of the current backend."""
+    return vector_type(values)
+
+
+def new_euler(values: Iterable[float]):
+    """Creates an euler rotation of the current backend."""
+    return euler_type(values)
+
+
+def get_vector_backend() -> str:
+    return _backend
+
+
+def set_vector_backend(name: str):
+    """Sets the types of the vectors and rotations in files that are read after this call.
+    'tuple' (the default) uses the Vector and Euler classes of this module, and 'mathutils' uses mathutils.Vector and
+    mathutils.Euler, which is useful for Blender addons. mathutils is only imported when it is selected.
+    """
+    global _backend, vector_type, euler_type
+
+    if name == 'tuple':
+        vector_type, euler_type = Vector, Euler
+    elif name == 'mathutils':
+        try:
+            import mathutils
+        except ImportError:
+            raise ImportError('mathutils is required for the mathutils vector backend') from None
+
+        # mathutils types do not support pickling, which is needed to send parsed files between processes
+        copyreg.pickle(mathutils.Vector, lambda vector: (mathutils.Vector, (tuple(vector),)))
+        copyreg.pickle(mathutils.Euler, lambda euler: (mathutils.Euler, (tuple(euler), euler.order)))
+
+        vector_type, euler_type = mathutils.Vector, mathutils.Euler
+    else:
+        raise Exception(f'Unknown vector backend: {name}')
+
+    _backend = name
@@ -1 +1,4 @@
 from .binary_reader.binary_reader import *
+
+from .memory_reader import MemoryReader
+from .page_cache import DiskPageCache, MemoryPageCache
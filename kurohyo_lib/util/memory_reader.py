@@ -0,0 +1,24 @@
+from .binary_reader.binary_reader import BinaryReader, Endian, Whence
+
+
+class MemoryReader(BinaryReader):
+    """A read-only BinaryReader that reads directly from an existing buffer (bytes, mmap, memoryview...).\n
+    BinaryReader always copies its buffer into a new bytearray, while this reader only keeps a memoryview of it.
+    """
+
+    def __init__(self, buffer, endianness: Endian = Endian.LITTLE, encoding='utf-8'):
+        super().__init__(endianness=endianness, encoding=encoding)
+
+        # Replace the (empty) bytearray that BinaryReader created with a view of the given buffer
+        self._BinaryReader__buf = memoryview(buffer).cast('B')
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # Views returned from read_view are separate from this one, so they stay valid after releasing
+        self._BinaryReader__buf.release()
+
+    def read_view(self, size: int) -> memoryview:
+        """Returns a memoryview of the given size from the current position without copying, and advances the position."""
+        pos = self.pos()
+        self.seek(size, Whence.CUR)
+
+        return self._BinaryReader__buf[pos:pos + size]
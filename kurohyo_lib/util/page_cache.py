@@ -0,0 +1,302 @@
+import hashlib
+import io
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+# Should be increased whenever the parsed objects or the entry layout change, so that old cache entries are not used
+CACHE_VERSION = 6
+
+CACHE_EXTENSION = '.pickle'
+
+# Magic, version, buffer count and pickle size, followed by the offset and size of each buffer
+ENTRY_MAGIC = b'KHPC'
+ENTRY_HEADER = struct.Struct('<4sIIQ')
+ENTRY_BUFFER = struct.Struct('<QQ')
+
+# Alignment of the buffers in an entry, so that arrays can be used directly from the mapped file
+BUFFER_ALIGNMENT = 64
+
+# Globals that cache entries can refer to, besides the record classes below
+ALLOWED_GLOBALS = {
+    ('builtins', 'bytearray'),
+    ('builtins', 'dict'),
+    ('builtins', 'frozenset'),
+    ('builtins', 'list'),
+    ('builtins', 'set'),
+    ('builtins', 'tuple'),
+    ('collections', 'defaultdict'),
+    ('copyreg', '_reconstructor'),
+    ('array', 'array'),
+    ('array', '_array_reconstructor'),
+    ('numpy', 'dtype'),
+    ('numpy', 'ndarray'),
+    ('numpy.core.multiarray', '_reconstruct'),
+    ('numpy.core.numeric', '_frombuffer'),
+    ('numpy._core.multiarray', '_reconstruct'),
+    ('numpy._core.numeric', '_frombuffer'),
+    ('mathutils', 'Euler'),
+    ('mathutils', 'Vector'),
+}
+
+STRUCTURE_MODULE = __name__.rsplit('.', 2)[0] + '.structure'
+
+# Classes of kurohyo_lib.structure that parsed files are made of, by the module they are defined in
+RECORD_CLASSES = {
+    'kh_enums': ('KHMateMaterialFlag', 'KHMigBlockFlag', 'KHMigImageFormatFlag', 'KHModeModelFlag', 'KHModeNodeFlag',
+                 'KHModeVertexFlag', 'KHPoseChannelFlag', 'KHPoseFlag'),
+    'khbase': ('KHBase', 'KHBaseBone'),
+    'khcame': ('KHCame', 'KHCameNode'),
+    'khfile': ('KHString',),
+    'khimag': ('KHImag', 'KHImagTexture'),
+    'khligh': ('KHLigh', 'KHLighNode'),
+    'khmate': ('KHMate', 'KHMateGroup', 'KHMateMaterial', 'KHMateTexture'),
+    'khmig': ('KHMig',),
+    'khmode': ('KHMode', 'KHModeMesh', 'KHModeNode', 'KHModeVertex', 'KHModeVertexBuffer'),
+    'khpose': ('KHPose', 'KHPoseBone', 'KHPoseChannel', 'KHPoseChannelArray', 'KHPoseKeyframe', 'KHPoseKeyframeFloat',
+               'KHPoseKeyframeShort'),
+    'khskel': ('KHSkel', 'KHSkelBone'),
+    'vector': ('Euler', 'Vector'),
+}
+
+ALLOWED_GLOBALS.update((f'{STRUCTURE_MODULE}.{module}', name) for module, names in RECORD_CLASSES.items()
+                       for name in names)
+
+
+def normalize_option(option) -> Any:
+    if isinstance(option, type):
+        return option.__name__
+    if isinstance(option, (set, frozenset)):
+        return sorted(map(normalize_option, option))
+    if isinstance(option, dict):
+        return sorted((normalize_option(key), value) for key, value in option.items())
+
+    return option
+
+
+def get_options_key(*options) -> str:
+    """Returns a string that represents the given read options.
+    Options contain types and sets, so the names are used to make the key the same between runs.
+    """
+    return repr(tuple(map(normalize_option, options)))
+
+
+class EntryUnpickler(pickle.Unpickler):
+    """Unpickler that only loads the types used by parsed pages, so that loading an entry cannot run arbitrary code."""
+
+    def find_class(self, module, name):
+        if (module, name) in ALLOWED_GLOBALS:
+            return super().find_class(module, name)
+
+        raise pickle.UnpicklingError(f'Global not allowed in cache entry: {module}.{name}')
+
+
+def write_entry(f, value: Any):
+    """Writes a cache entry. Contiguous arrays are stored separately from the pickled objects (as out-of-band buffers),
+    so that they can be used from the mapped entry instead of being copied.
+    """
+    buffers = list()
+    data = pickle.dumps(value, 5, buffer_callback=buffers.append)
+    views = [buffer.raw() for buffer in buffers]
+
+    table = list()
+    offset = ENTRY_HEADER.size + ENTRY_BUFFER.size * len(views) + len(data)
+    for view in views:
+        offset += -offset % BUFFER_ALIGNMENT
+        table.append(ENTRY_BUFFER.pack(offset, view.nbytes))
+        offset += view.nbytes
+
+    f.write(ENTRY_HEADER.pack(ENTRY_MAGIC, CACHE_VERSION, len(views), len(data)))
+    f.write(b''.join(table))
+    f.write(data)
+
+    for view in views:
+        f.write(bytes(-f.tell() % BUFFER_ALIGNMENT))
+        f.write(view)
+
+
+def read_entry(data: mmap.mmap) -> Any:
+    """Reads a cache entry. Arrays keep referencing the mapped entry."""
+    magic, version, buffer_count, pickle_size = ENTRY_HEADER.unpack_from(data)
+    if magic != ENTRY_MAGIC or version != CACHE_VERSION:
+        raise Exception(f'Invalid cache entry: magic {magic}, version {version}')
+
+    view = memoryview(data)
+    buffers = list()
+    for i in range(buffer_count):
+        offset, size = ENTRY_BUFFER.unpack_from(data, ENTRY_HEADER.size + i * ENTRY_BUFFER.size)
+        buffers.append(view[offset:offset + size])
+
+    pickle_start = ENTRY_HEADER.size + buffer_count * ENTRY_BUFFER.size
+    return EntryUnpickler(io.BytesIO(view[pickle_start:pickle_start + pickle_size]), buffers=buffers).load()
+
+
+class DiskPageCache:
+    """Stores parsed pages in a directory, so that pages that were already parsed can be loaded instead.
+    Entries are keyed by a hash of the page bytes and the options that the page was read with, so they stay valid
+    even if the archive is moved or other pages are changed.
+    When the total size of the entries goes over max_size, the least recently used entries are removed.
+    Can be shared between processes, as entries are written atomically. Entries can only contain the types of parsed
+    pages (see EntryUnpickler), and their arrays are memory-mapped when loading, so only pages that are read into arrays
+    (see read_elpk) are faster to load from the cache than to parse.
+    """
+
+    def __init__(self, directory: str, max_size=0x40000000):
+        self.directory = directory
+        self.max_size = max_size
+
+        # Total size of the entries, computed on the first store
+        self._size: Optional[int] = None
+
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def get_key(data, *options) -> str:
+        """Returns the key of the page with the given bytes and read options."""
+        h = hashlib.blake2b(digest_size=20)
+        h.update(get_options_key(CACHE_VERSION, *options).encode())
+        h.update(data)
+
+        return h.hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + CACHE_EXTENSION)
+
+    def load(self, key: str) -> Optional[Any]:
+        """Returns the cached object, or None if there is no entry with the given key."""
+        path = self.get_path(key)
+
+        try:
+            with open(path, 'rb') as f:
+                # Copy-on-write map, so that the loaded arrays can be modified without changing the entry
+                value = read_entry(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY))
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Entry is corrupted (or was written by an incompatible version), so remove it
+            self.remove(path)
+            return None
+
+        # Modification time is used for finding the least recently used entries
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return value
+
+    def store(self, key: str, value: Any):
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            write_entry(f, value)
+            size = f.tell()
+
+        os.replace(temp_path, self.get_path(key))
+
+        if self._size is None:
+            self._size = self.get_total_size()
+        else:
+            self._size += size
+
+        if self._size > self.max_size:
+            self.evict()
+
+    def remove(self, path: str) -> int:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return 0
+
+        return size
+
+    def get_entries(self):
+        return [entry for entry in os.scandir(self.directory) if entry.name.endswith(CACHE_EXTENSION)]
+
+    def get_total_size(self) -> int:
+        return sum(entry.stat().st_size for entry in self.get_entries())
+
+    def evict(self):
+        """Removes the least recently used entries until the total size is at most max_size."""
+        entries = [(entry.stat(), entry.path) for entry in self.get_entries()]
+        entries.sort(key=lambda entry: entry[0].st_mtime)
+
+        self._size = sum(stat.st_size for stat, _ in entries)
+        for stat, path in entries:
+            if self._size <= self.max_size:
+                break
+
+            self._size -= self.remove(path) or stat.st_size
+
+    def clear(self):
+        for entry in self.get_entries():
+            self.remove(entry.path)
+
+        self._size = 0
+
+
+class MemoryPageCache:
+    """Keeps parsed pages in memory, for processes that read the same archives many times.
+    The memory used by a page is estimated as its size in the file multiplied by size_factor. When the total estimate
+    goes over max_bytes, the least recently used pages are removed.
+    Cached pages are shared between all reads that use them, so they should not be modified.
+    """
+
+    def __init__(self, max_bytes=0x10000000, size_factor=8):
+        self.max_bytes = max_bytes
+        self.size_factor = size_factor
+
+        self.entries: OrderedDict = OrderedDict()
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int):
+        """Adds a value to the cache. size is the size of the value in the file, before being parsed."""
+        size *= self.size_factor
+
+        with self._lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+
+            # Values that are larger than the whole cache are not kept
+            if size > self.max_bytes:
+                return
+
+            self.entries[key] = (value, size)
+            self.size += size
+
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.size = 0